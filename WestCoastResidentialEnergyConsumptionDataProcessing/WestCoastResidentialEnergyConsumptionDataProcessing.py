@@ -1,130 +1,80 @@
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-from enum import Enum
+from regions import (Region, region_registry, natural_gas_source_regions, natural_gas_data_path, has_natural_gas_data,
+                     has_electricity_data)
+from chart_rendering import PieChartJob, LineChartJob, AtlasJob, AtlasBookJob, render_chart, render_charts
+from instrumentation import instrumented, stage
+from sector_records import SectorTable, first_record
+from energy_dataset import EnergyDataset
+from eia_data_loader import (load_natural_gas_table, electricity_sales_index, electricity_generation_index,
+                             load_natural_gas_monthly_table, electricity_sales_monthly_index,
+                             natural_gas_sector_keywords, electricity_sector_names, generation_source_names,
+                             period_year, ingest_sources)
+
+@instrumented('parse_natural_gas_data_for_state_at_year', 'path_to_state_data')
+def parse_natural_gas_data_for_state_at_year(path_to_state_data, year_of_interest):
+    # The file is only read once, every later call is a view over the cached table
+    data_for_state = load_natural_gas_table(path_to_state_data)
 
-class Region(Enum):
-    WASHINGTON = "Washington"
-    OREGON = "Oregon"
-    CALIFORNIA = "California"
-    WEST_COAST = "West Coast"
-    UNITED_STATES = "United States"
+    rows_for_year = data_for_state[data_for_state['Date'] == year_of_interest]
+    data_for_specific_year = rows_for_year.pivot(index='Date', columns='Sector', values='Value').reset_index()
+    data_for_specific_year.columns.name = None
 
-def parse_natural_gas_data_for_state_at_year(path_to_state_data, year_of_interest):
-    data_for_state = pd.read_csv(path_to_state_data, skiprows=2)
+    # Keep the expected consumption categories in their usual order
+    columns_of_interest = ['Date'] + list(natural_gas_sector_keywords.values())
+    data_for_specific_year = data_for_specific_year.reindex(columns=columns_of_interest)
 
-    # Cleanup
-    data_for_state = data_for_state.dropna(subset=['Date'])
-    data_for_state['Date'] = data_for_state['Date'].astype(int)
-    data_for_state = data_for_state.fillna(0)
-    
-    # Drop the unwanted 'Unnamed: 10' column if it exists
-    if 'Unnamed: 10' in data_for_state.columns:
-        data_for_state.drop(columns=['Unnamed: 10'], inplace=True)
-
-    # Dynamic renaming based on keywords to filter out location names, and get eveyrthign on the same naming scheme
-    keywords = {
-        'Residential': 'Residential',
-        'Commercial': 'Commercial',
-        'Industrial': 'Industrial',
-        'Vehicle Fuel Consumption': 'Vehicle Fuel',
-        'Electric Power': 'Electric Power',
-        'Delivered to Consumers': 'Total Delivered'
-    }
-    rename_columns = {}
-    for col in data_for_state.columns:
-        for keyword, new_name in keywords.items():
-            if keyword in col:
-                rename_columns[col] = new_name
+    return data_for_specific_year
 
-    data_for_state.rename(columns=rename_columns, inplace=True)
 
-    # Select the relevant columns based on the expected consumption categories
-    columns_of_interest = ['Date'] + list(keywords.values())
-    data_for_state = data_for_state[columns_of_interest]
-    
-    data_for_specific_year = data_for_state[data_for_state['Date'] == year_of_interest]
+@instrumented('parse_natural_gas_data_for_state_by_month', 'path_to_state_data')
+def parse_natural_gas_data_for_state_by_month(path_to_state_data, year_of_interest):
+    # Same columns as the annual view, one row per month of the year from the _M file
+    data_for_state = load_natural_gas_monthly_table(path_to_state_data)
 
-    return data_for_specific_year
+    rows_for_year = data_for_state[data_for_state['Date'].dt.year == year_of_interest]
+    data_by_month = rows_for_year.pivot(index='Date', columns='Sector', values='Value').reset_index()
+    data_by_month.columns.name = None
 
+    columns_of_interest = ['Date'] + list(natural_gas_sector_keywords.values())
+    return data_by_month.reindex(columns=columns_of_interest)
 
-def make_pie_chart_of_natural_gas_data(state_data_for_one_year, location_name, year, save_folder, show = False):
-    data_row = state_data_for_one_year.iloc[0]
+def natural_gas_pie_chart_job(data_row, location_name, year, save_folder):
+    # data_row is a SectorRecord, see sector_records.py
 
     # Prepare data for the pie chart, excluding the 'Date' and 'Total Delivered' columns
     sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Electric Power']
-    consumption_values = [data_row[sector] for sector in sectors]
+    consumption_values = [float(data_row[sector]) for sector in sectors]
 
     # Define labels and colors for the pie chart
     labels = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Electric Power']
     colors = ['skyblue', 'yellowgreen', 'coral', 'gold', 'lightpink']
 
-    # Function to format pie chart percentages and adjust label positioning
-    def autopct_format(pct):
-        return f'{pct:.1f}%' if pct >= 5 else ''
-
-    # Create the pie chart with improved label positioning
-    plt.figure(figsize=(10, 8))
-    wedges, texts, autotexts = plt.pie(consumption_values, labels=labels, colors=colors, 
-                                       autopct=autopct_format, startangle=140, 
-                                       textprops={'fontsize': 14}, pctdistance=0.85)
-
-    # Adjust the position of labels to ensure they don't overlap
-    for text, autotext in zip(texts, autotexts):
-        if autotext.get_text() == '':
-            text.set_visible(False)
-
     title = f'Natural Gas Consumption by Sector in {location_name} ({year})'
-    plt.title(title, fontsize=16, pad=18)
-    plt.tight_layout()
-    plt.axis('equal')  # Equal aspect ratio ensures that the pie chart is circular.
-    filepath = save_folder + title
-    plt.savefig(filepath, transparent=True)
+    return PieChartJob(title, save_folder + title, consumption_values, labels, colors, (10, 8))
 
-    # Display the pie chart
-    if show:
-        plt.show()
-
-def make_pie_chart_of_electrical_data(state_data_for_one_year, location_name, year, save_folder, show = False):
-    data_row = state_data_for_one_year.iloc[0]
+@instrumented('make_pie_chart_of_natural_gas_data', 'location_name')
+def make_pie_chart_of_natural_gas_data(state_data_for_one_year, location_name, year, save_folder, show = False):
+    render_chart(natural_gas_pie_chart_job(first_record(state_data_for_one_year), location_name, year, save_folder), show)
 
+def electrical_pie_chart_job(data_row, location_name, year, save_folder):
     # Prepare data for the pie chart, excluding the 'Date' column
     sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
-    consumption_values = [data_row[sector] for sector in sectors]
+    consumption_values = [float(data_row[sector]) for sector in sectors]
 
     # Define labels and colors for the pie chart
     labels = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
     colors = ['skyblue', 'yellowgreen', 'coral', 'gold', 'lightpink']
 
-    # Function to format pie chart percentages and adjust label positioning
-    def autopct_format(pct):
-        return f'{pct:.1f}%' if pct >= 5 else ''
-
-    # Create the pie chart with improved label positioning
-    plt.figure(figsize=(10, 8))
-    wedges, texts, autotexts = plt.pie(consumption_values, labels=labels, colors=colors, 
-                                       autopct=autopct_format, startangle=140, 
-                                       textprops={'fontsize': 14}, pctdistance=0.85)
-
-    # Adjust the position of labels to ensure they don't overlap
-    for text, autotext in zip(texts, autotexts):
-        if autotext.get_text() == '':
-            text.set_visible(False)
-
     title = f'Electricity Consumption by Sector in {location_name} ({year})'
-    plt.title(title, fontsize=16, pad=18)
-    plt.tight_layout()
-    plt.axis('equal')  # Equal aspect ratio ensures that the pie chart is circular.
-    filepath = save_folder + title
-    plt.savefig(filepath, transparent=True)
-
-    # Display the pie chart
-    if show:
-        plt.show()
+    return PieChartJob(title, save_folder + title, consumption_values, labels, colors, (10, 8))
 
-def make_pie_chart_of_combined_data(state_data_for_one_year, location_name, year, save_folder, combined = True, show = False):
-    data_row = state_data_for_one_year.iloc[0]
+@instrumented('make_pie_chart_of_electrical_data', 'location_name')
+def make_pie_chart_of_electrical_data(state_data_for_one_year, location_name, year, save_folder, show = False):
+    render_chart(electrical_pie_chart_job(first_record(state_data_for_one_year), location_name, year, save_folder), show)
 
+def combined_pie_chart_job(data_row, location_name, year, save_folder, combined = True):
     # Prepare data for the pie chart, excluding the 'Date' column
     sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
 
@@ -153,161 +103,86 @@ def make_pie_chart_of_combined_data(state_data_for_one_year, location_name, year
         labels = interleaved_labels
     
     colors = [base_colors.get(sector, darker_colors.get(sector, 'grey')) for sector in sectors]
-    consumption_values = [data_row[sector] for sector in sectors]
-
-    # Function to format pie chart percentages and adjust label positioning
-    def autopct_format(pct):
-        return f'{pct:.1f}%' if pct >= 5 else ''
-
-
-    # Create the pie chart with improved label positioning
-    plt.figure(figsize=(12, 8))
-    wedges, texts, autotexts = plt.pie(consumption_values, labels=labels, colors=colors,
-                                        autopct=autopct_format, startangle=140,
-                                        textprops={'fontsize': 14}, pctdistance=0.85)
-
-    # Adjust the position of labels to ensure they don't overlap
-    for text, autotext in zip(texts, autotexts):
-        if autotext.get_text() == '':
-            text.set_visible(False)
+    consumption_values = [float(data_row[sector]) for sector in sectors]
 
     title = f'Natural gas use by Sector in {location_name} ({year})'
-    plt.title(title, fontsize=16, pad=18)
-    plt.tight_layout()
-    plt.axis('equal')  # Equal aspect ratio ensures that the pie chart is circular.
     filepath = save_folder + title
     if combined: 
         filepath += ' combined'
-    plt.savefig(filepath, transparent=True)
+    return PieChartJob(title, filepath, consumption_values, labels, colors, (12, 8))
 
-    # Display the pie chart
-    if show:
-        plt.show()
-
-def make_pie_chart_of_electrical_source_data(state_data_for_one_year, location_name, year, save_folder, show = False):
-    data_row = state_data_for_one_year.iloc[0]
+@instrumented('make_pie_chart_of_combined_data', 'location_name')
+def make_pie_chart_of_combined_data(state_data_for_one_year, location_name, year, save_folder, combined = True, show = False):
+    render_chart(combined_pie_chart_job(first_record(state_data_for_one_year), location_name, year, save_folder, combined), show)
 
+def electrical_source_pie_chart_job(data_row, location_name, year, save_folder):
     # Prepare data for the pie chart, excluding the 'Date' column
     sources = ['Fossil Fuels', 'Renewable']
-    consumption_values = [data_row[source] for source in sources]
+    consumption_values = [float(data_row[source]) for source in sources]
 
     # Define labels and colors for the pie chart
     labels = ['Fossil Fuels', 'Renewable']
     colors = ['skyblue', 'yellowgreen', 'coral', 'gold', 'lightpink']
 
-    # Function to format pie chart percentages and adjust label positioning
-    def autopct_format(pct):
-        return f'{pct:.1f}%' if pct >= 5 else ''
-
-    # Create the pie chart with improved label positioning
-    plt.figure(figsize=(10, 8))
-    wedges, texts, autotexts = plt.pie(consumption_values, labels=labels, colors=colors, 
-                                       autopct=autopct_format, startangle=140, 
-                                       textprops={'fontsize': 14}, pctdistance=0.85)
-
-    # Adjust the position of labels to ensure they don't overlap
-    for text, autotext in zip(texts, autotexts):
-        if autotext.get_text() == '':
-            text.set_visible(False)
-
     title = f'Electricity Production by Carbon Footprint in {location_name} ({year})'
-    plt.title(title, fontsize=16, pad=18)
-    plt.tight_layout()
-    plt.axis('equal')  # Equal aspect ratio ensures that the pie chart is circular.
-    filepath = save_folder + title
-    plt.savefig(filepath, transparent=True)
+    return PieChartJob(title, save_folder + title, consumption_values, labels, colors, (10, 8))
 
-    # Display the pie chart
-    if show:
-        plt.show()
+@instrumented('make_pie_chart_of_electrical_source_data', 'location_name')
+def make_pie_chart_of_electrical_source_data(state_data_for_one_year, location_name, year, save_folder, show = False):
+    render_chart(electrical_source_pie_chart_job(first_record(state_data_for_one_year), location_name, year, save_folder), show)
 
+@instrumented('combine_state_ng_data')
 def combine_state_ng_data(data_frames):
     # Combine all data frames by summing up their values
-    combined_data = pd.concat(data_frames).groupby('Date').sum()
+    with stage('groupby sum'):
+        combined_data = pd.concat(data_frames).groupby('Date').sum()
     # Reset the index so 'Date' becomes a column again, if you want to keep the 'Date' information
     combined_data.reset_index(inplace=True)
     return combined_data
 
 
 
-def parse_electricity_data_by_sector(path_to_data, year_of_interest, location_string):
-    # Load data
-    data = pd.read_csv(path_to_data, skiprows=4)
-
-    # Select only the relevant year column along with the description
-    data = data[['description', str(year_of_interest)]]
-
-    # Cleanup and prepare data
-    data['Sector'] = data['description'].str.extract(r': (.*)')[0].fillna(data['description'])
-
-    # Convert "--" to NaN to handle it easily later and fill with 0
-    data[str(year_of_interest)] = pd.to_numeric(data[str(year_of_interest)], errors='coerce').fillna(0)
-
-    # Map sector descriptions to standardized sector names
-    rename_map = {
-        'all sectors': 'Total Delivered',
-        'residential': 'Residential',
-        'commercial': 'Commercial',
-        'industrial': 'Industrial',
-        'transportation': 'Vehicle Fuel',
-        'other': 'Other'
-    }
-    data['Sector'] = data['Sector'].apply(lambda x: rename_map.get(x.lower().strip(), x.strip()))
-
-    # Filter only location specific data
-    location_data = data[data['description'].str.contains(location_string)]
+def _location_pivot(region_index, year_of_interest, location_string, category_column):
+    # Only location specific data for the year, straight from the prebuilt region index
+    location_data = region_index.rows(location_string, year_of_interest)
 
     # Pivot the data to have sectors as columns
-    location_data_pivot = location_data.pivot_table(index='description', columns='Sector', values=str(year_of_interest), aggfunc='sum').fillna(0)
+    with stage('pivot_table', location_string):
+        location_data_pivot = location_data.pivot_table(index='description', columns=category_column, values='Value', aggfunc='sum').fillna(0)
 
     # Reset index to drop the description from the index (removes 'description' from being part of the data)
     location_data_pivot = location_data_pivot.reset_index(drop=True)
 
     # Sum across the rows if needed (this ensures you get one row of summary data)
     location_final = location_data_pivot.sum(axis=0).to_frame().transpose()
+    location_final.columns.name = None
     location_final.insert(0, 'Date', year_of_interest)
 
     return location_final
 
+@instrumented('parse_electricity_data_by_sector', 'location_string')
+def parse_electricity_data_by_sector(path_to_data, year_of_interest, location_string):
+    # Sectors are already mapped to standardized names in the cached table
+    region_index = electricity_sales_index(path_to_data)
+    return _location_pivot(region_index, year_of_interest, location_string, 'Sector')
+
+@instrumented('parse_electricity_data_by_sector_by_month', 'location_string')
+def parse_electricity_data_by_sector_by_month(path_to_data, year_of_interest, location_string):
+    # One row per month of the year from a freq=M export, lines up with parse_natural_gas_data_for_state_by_month
+    location_data = electricity_sales_monthly_index(path_to_data).rows(location_string)
+    location_data = location_data[location_data['Date'].dt.year == year_of_interest]
+    with stage('pivot_table', location_string):
+        data_by_month = location_data.pivot_table(index='Date', columns='Sector', values='Value', aggfunc='sum').fillna(0)
+    data_by_month.columns.name = None
+    return data_by_month.reset_index()
+
+@instrumented('parse_electricity_generation_data_carbon', 'location_string')
 def parse_electricity_generation_data_carbon(path_to_data, year_of_interest, location_string):
-    # Load data
-    data = pd.read_csv(path_to_data, skiprows=4)
-
-    # Select only the relevant year column along with the description
-    data = data[['description', str(year_of_interest)]]
-
-    # Cleanup and prepare data
-    data['Source'] = data['description'].str.extract(r': (.*)')[0].fillna(data['description'])
-
-    # Convert "--" to NaN to handle it easily later and fill with 0
-    data[str(year_of_interest)] = pd.to_numeric(data[str(year_of_interest)], errors='coerce').fillna(0)
-
-    # Map source descriptions to standardized source names
-    rename_map = {
-        'all fuels': 'Total Generated',
-        'coal': 'Coal',
-        'petroleum liquids': 'Petroluem',
-        'petroleum coke': 'Petroleum Coke',
-        'natural gas': 'Natural Gas',
-        'other': 'Other gases'
-    }
-    data['Source'] = data['Source'].apply(lambda x: rename_map.get(x.lower().strip(), x.strip()))
-
-    # Filter only location specific data
-    location_data = data[data['description'].str.contains(location_string)]
-
-    # Pivot the data to have sectors as columns
-    location_data_pivot = location_data.pivot_table(index='description', columns='Source', values=str(year_of_interest), aggfunc='sum').fillna(0)
-
-    # Reset index to drop the description from the index (removes 'description' from being part of the data)
-    location_data_pivot = location_data_pivot.reset_index(drop=True)
-
-    # Sum across the rows if needed (this ensures you get one row of summary data)
-    location_final = location_data_pivot.sum(axis=0).to_frame().transpose()
-    location_final.insert(0, 'Date', year_of_interest)
-
-    return location_final
+    # Sources are already mapped to standardized names in the cached table
+    region_index = electricity_generation_index(path_to_data)
+    return _location_pivot(region_index, year_of_interest, location_string, 'Source')
 
+@instrumented('calculate_renewable_vs_fossil')
 def calculate_renewable_vs_fossil(data):
     # Sum the fossil fuel sources to a new column 'Fossil Fuels'
     fossil_fuels_sources = ['Coal', 'Natural Gas', 'Petroleum Coke', 'Petroluem']
@@ -324,206 +199,505 @@ def calculate_renewable_vs_fossil(data):
 
     return data
 
+fossil_fuels_sources = ['Coal', 'Natural Gas', 'Petroleum Coke', 'Petroluem']
 
-def allocate_ng_to_electricity_sectors(ng_data, electricity_data, combine):
-    sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
-    # Find the proportion of natural gas used for electric power
-    ng_for_electric_power = ng_data['Electric Power'].iloc[0]
-    total_electricity_usage = electricity_data.drop(columns=['Date', 'Total Delivered']).sum(axis=1).iloc[0]
+# Metric tons of CO2 per MWh generated, EIA's average rates by fuel (petroleum coke counted
+# as petroleum). Every other source counts as zero, other gases included, as 'Fossil Fuels' leaves them out too
+carbon_emission_factors = {'Coal': 1.04, 'Natural Gas': 0.44, 'Petroluem': 1.08, 'Petroleum Coke': 1.08}
+
+def _total_generated(generation):
+    total_column = 'Total Generated' if 'Total Generated' in generation.columns else 'all fuels (utility-scale)'
+    return generation.column(total_column)
+
+@instrumented('renewable_vs_fossil_records')
+def renewable_vs_fossil_records(generation):
+    # calculate_renewable_vs_fossil for every row of a generation SectorTable at once
+    fossil_fuels = generation.columns_for(fossil_fuels_sources).sum(axis=1)
+    return generation.with_columns({'Fossil Fuels': fossil_fuels,
+                                    'Renewable': _total_generated(generation) - fossil_fuels})
 
-    # Calculate the percentage of each sector's usage out of the total usage
-    sector_percentages = electricity_data.drop(columns=['Date', 'Total Delivered']).div(total_electricity_usage)
+@instrumented('generation_mix_records')
+def generation_mix_records(generation):
+    # renewable_vs_fossil_records plus the CO2 of the generation (thousand metric tons, the
+    # generation is in thousand MWh) and its generation-weighted carbon intensity (metric
+    # tons per MWh), for every region-year of the table in one pass
+    emissions = generation.columns_for(list(carbon_emission_factors)) @ np.array(list(carbon_emission_factors.values()))
+    total = _total_generated(generation)
+    intensity = np.divide(emissions, total, out=np.zeros(len(total)), where=total > 0)
+    return renewable_vs_fossil_records(generation).with_columns({'CO2': emissions, 'Carbon Intensity': intensity})
 
-    # Allocate natural gas usage to each electricity sector based on the percentage
-    ng_allocation = sector_percentages.apply(lambda x: x * ng_for_electric_power)
 
-    # You can either add this directly to the electricity_data or create a new DataFrame
-    # Here we will add it directly to the electricity_data DataFrame
+@instrumented('allocate_ng_to_electricity_sectors')
+def allocate_ng_to_electricity_sectors(ng_data, electricity_data, combine):
+    # Single year version, kept for callers that work one row at a time. Its split columns
+    # follow the order of electricity_data's columns, as they always have
+    usage_sectors = [sector for sector in electricity_data.columns if sector not in ('Date', 'Total Delivered')]
+    allocated = allocate_ng_to_electricity_sectors_batch(ng_data.set_index('Date'), electricity_data.set_index('Date'), combine,
+                                                         usage_sectors)
+    return allocated.reset_index()
+
+@instrumented('allocate_ng_to_electricity_sectors_batch')
+def allocate_ng_to_electricity_sectors_batch(ng_data, electricity_data, combine, usage_sectors = None):
+    # ng_data and electricity_data share an index (e.g. (Region, Date)) with one row per region-year
+    allocated = allocate_ng_records(SectorTable.from_frame(ng_data), SectorTable.from_frame(electricity_data), combine,
+                                    usage_sectors=usage_sectors)
+    return allocated.to_frame()
+
+# Canonical order of the split allocation's '<Sector> Electricity' columns
+electricity_usage_sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
+
+@instrumented('allocate_ng_records')
+def allocate_ng_records(ng_records, electricity_records, combine, generation_mix = None, usage_sectors = None):
+    # Every allocation for every row of the SectorTables is done in one broadcast. With a
+    # generation_mix (see generation_mix_records) each sector also gets '<Sector> Electricity CO2'.
+    # The electricity sectors are laid out in usage_sectors order, by default
+    # electricity_usage_sectors then any others, whatever order the table has
+    if usage_sectors is None:
+        usage_sectors = [sector for sector in electricity_usage_sectors if sector in electricity_records.columns]
+        usage_sectors += [sector for sector in electricity_records.sectors
+                          if sector not in usage_sectors and sector != 'Total Delivered']
+    usage_values = electricity_records.aligned(ng_records.index, usage_sectors)
+
+    # Percentage of each sector's usage out of the total usage, times the natural gas used for electric power.
+    # Rows without retail sales (the files cover different years) allocate nothing and keep their direct use
+    # (summed in the table's column order, as the single year version always has)
+    table_order = np.argsort([electricity_records.columns[sector] for sector in usage_sectors])
+    total_usage = usage_values[:, table_order].sum(axis=1, keepdims=True)
+    sector_percentages = np.divide(usage_values, total_usage, out=np.zeros_like(usage_values), where=total_usage > 0)
+    ng_allocation = sector_percentages * ng_records.column('Electric Power')[:, None]
+
+    # Either add it to the natural gas sectors, or keep it as its own "<Sector> Electricity" column,
+    # sectors only in the electricity data start out at 0
+    sectors = list(ng_records.sectors)
     if (combine):
-        for sector in ng_allocation.columns:
-            if sector not in ng_data.columns:
-                ng_data[sector] = 0
-            ng_data[sector] = ng_data[sector] +  ng_allocation[sector].values
+        sectors += [sector for sector in usage_sectors if sector not in ng_records.columns]
     else:
-        print ("combine!")
-        for sector in ng_allocation.columns:
-            if sector not in ng_data.columns:
-                ng_data[sector] = 0
-            ng_data[sector + " Electricity"] = ng_allocation[sector].values
-
-    return ng_data
+        for sector in usage_sectors:
+            if sector not in sectors:
+                sectors.append(sector)
+            sectors.append(sector + " Electricity")
+    columns = {sector: position for position, sector in enumerate(sectors)}
+
+    values = np.zeros((len(ng_records), len(sectors)))
+    values[:, [columns[sector] for sector in ng_records.sectors]] = ng_records.values
+    if (combine):
+        values[:, [columns[sector] for sector in usage_sectors]] += ng_allocation
+    else:
+        values[:, [columns[sector + " Electricity"] for sector in usage_sectors]] = ng_allocation
+
+    if generation_mix is not None:
+        # Thousand metric tons of CO2 from each sector's electricity use at the region-year's
+        # carbon intensity, months use their year's; region-years without generation data get 0
+        keys = [(region, period_year(date)) for region, date in ng_records.index]
+        intensity = generation_mix.aligned(keys, ['Carbon Intensity'])
+        values = np.column_stack([values, usage_values * intensity])
+        sectors += [sector + " Electricity CO2" for sector in usage_sectors]
+
+    return SectorTable(ng_records.index, sectors, values)
+
+def _natural_gas_table(region, frequency):
+    if frequency == 'M':
+        return load_natural_gas_monthly_table(natural_gas_data_path(region, data_folder, 'M'))
+    return load_natural_gas_table(ng_data_path_dict[region])
+
+def _electricity_sales_index(frequency):
+    if frequency == 'M':
+        return electricity_sales_monthly_index(retail_sales_of_electricity_monthly_path)
+    return electricity_sales_index(retail_sales_of_electricity_path)
+
+def _in_years(dates, years, frequency):
+    return (dates.year if frequency == 'M' else dates).isin(list(years))
+
+def _frame_by_region(summed, regions, columns = None):
+    # (Region, Date)-indexed frame of the regions' rows in summed (indexed by region name and Date).
+    # Regions without any rows (e.g. none in the selected years) are left out; with no rows at
+    # all the frame is empty, with columns (default: summed's)
+    present = set(summed.index.get_level_values(0)) if len(summed) else set()
+    frames = {region: summed.loc[region.name] for region in regions if region.name in present}
+    if not frames:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['Region', 'Date']),
+                            columns=list(summed.columns if columns is None else columns), dtype=float)
+    return pd.concat(frames, names=['Region', 'Date'])
+
+@instrumented('natural_gas_data_by_region')
+def natural_gas_data_by_region(regions, frequency = 'A', sectors = None, load_source = None):
+    # All years (or months, with frequency='M') of natural gas data for each region, indexed by (Region, Date).
+    # Each source file is loaded once, and every composite region (e.g. the West Coast)
+    # comes out of a single group-sum over its member states. load_source(region) can hand
+    # in an already pruned table of that region's file (see EnergyDataset), sectors then
+    # names the columns it has
+    regions = list(regions)
+    if load_source is None:
+        load_source = lambda source: _natural_gas_table(source, frequency)
+    membership = pd.DataFrame([(region.name, source.name) for region in regions
+                               for source in natural_gas_source_regions(region)], columns=['Region', 'Source'])
+    source_data = pd.concat([load_source(Region[source]).assign(Source=source)
+                             for source in membership['Source'].unique()], ignore_index=True)
+    with stage('groupby sum'):
+        summed = membership.merge(source_data, on='Source').groupby(['Region', 'Date', 'Sector'])['Value'].sum()
+        summed = summed.unstack('Sector')
+
+    columns = list(natural_gas_sector_keywords.values()) if sectors is None else list(sectors)
+    data = _frame_by_region(summed, regions, columns)
+    data.columns.name = None
+    return data[columns]
+
+# Columns of a browser table without any selected rows
+browser_category_names = {'Sector': list(electricity_sector_names.values()),
+                          'Source': list(generation_source_names.values())}
+
+def _browser_data_by_region(region_index, regions, category_column):
+    # Rows of every region's location (or of its members' locations, when a composite region
+    # is not published), summed per (Region, Date, category) in one group-sum
+    regions = list(regions)
+    selected = []
+    for region in regions:
+        location_data = region_index.rows(electricity_data_region_string[region])
+        if location_data.empty and region_registry[region].members:
+            location_data = pd.concat([region_index.rows(electricity_data_region_string[member])
+                                       for member in region_registry[region].members])
+        selected.append(location_data.assign(Target=region.name))
+    with stage('groupby sum'):
+        summed = pd.concat(selected, ignore_index=True).groupby(['Target', 'Date', category_column])['Value'].sum()
+        summed = summed.unstack(category_column)
+
+    data = _frame_by_region(summed, regions, None if len(summed) else browser_category_names[category_column]).fillna(0)
+    data.columns.name = None
+    return data
 
-def residential_energy_use_over_time(start_year, end_year, region : Region, save_folder = '../', show_all = False):
-    all_years_data = []
-    
-    for year in range(start_year, end_year + 1):
-        if (region is Region.WEST_COAST):
-            w_ng_d = parse_natural_gas_data_for_state_at_year(ng_data_path_dict[Region.WASHINGTON], year) 
-            o_ng_d = parse_natural_gas_data_for_state_at_year(ng_data_path_dict[Region.OREGON], year) 
-            c_ng_d = parse_natural_gas_data_for_state_at_year(ng_data_path_dict[Region.CALIFORNIA], year) 
-            ng_usage_raw_data = combine_state_ng_data([w_ng_d, o_ng_d, c_ng_d])
-        else:
-            ng_usage_raw_data = parse_natural_gas_data_for_state_at_year(ng_data_path_dict[region], year)
-        
-        electricity_usage_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year, electricity_data_region_string[region])
-
-        combined_ng_usage_data = allocate_ng_to_electricity_sectors(ng_usage_raw_data, electricity_usage_data, True)\
-        
-        
-        # Extract only the residential data for the year
-        residential_value = combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, 'Residential'].iloc[0]
-        if (show_all) :
-            commercial_value = combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, 'Commercial'].iloc[0]
-            Industrial_value = combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, 'Industrial'].iloc[0]
-            vehicle_value = combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, 'Vehicle Fuel'].iloc[0]
-            other_value = combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, 'Other'].iloc[0]
-        # sectors = ['Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
-        # total_value = residential_value
-        # for sector in sectors:
-        #     total_value = total_value + combined_ng_usage_data.loc[combined_ng_usage_data['Date'] == year, sector].iloc[0]
-        # residential_percentage = residential_value / total_value
-        
-        if (show_all) :
-            all_years_data.append({'Year': year, 'Residential': residential_value, 'Commercial' : commercial_value, 'Industrial' : Industrial_value,'Vehicle Fuel' : vehicle_value, 'Other' : other_value})
-        else:
-            all_years_data.append({'Year': year, 'Residential': residential_value})
-
-    # Convert the list of dictionaries to a DataFrame
-    all_years_df = pd.DataFrame(all_years_data)
-    all_years_df.set_index('Year', inplace=True)  # Set 'Year' as the index
-
-    # Plotting
-    plt.figure(figsize=(10, 5))
-    if show_all:
-        # Define a color map for the sectors
-        color_map = {
-            'Residential': 'blue',
-            'Commercial': 'green',
-            'Industrial': 'red',
-            'Vehicle Fuel': 'purple',
-            'Other': 'orange'
-        }
-        for sector, color in color_map.items():
-            all_years_df[sector].plot(kind='line', marker='o', color=color, label=sector)
+@instrumented('electricity_data_by_region')
+def electricity_data_by_region(regions, frequency = 'A', region_index = None):
+    # All years (or months) of retail sales for each region, indexed by (Region, Date),
+    # or of only the rows in region_index when given one over a pruned table
+    if region_index is None:
+        region_index = _electricity_sales_index(frequency)
+    return _browser_data_by_region(region_index, regions, 'Sector')
+
+@instrumented('electricity_generation_data_by_region')
+def electricity_generation_data_by_region(regions, region_index = None):
+    # All years of net generation by source for each region, indexed by (Region, Date)
+    if region_index is None:
+        region_index = electricity_generation_index(net_generation_for_all_sectors_path)
+    return _browser_data_by_region(region_index, regions, 'Source')
+
+@instrumented('generation_mix_records_by_region')
+def generation_mix_records_by_region(regions):
+    # Every source, Fossil Fuels, Renewable, CO2 and Carbon Intensity of every region-year,
+    # from a single read of the generation file
+    return generation_mix_records(SectorTable.from_frame(electricity_generation_data_by_region(regions)))
+
+@instrumented('allocated_ng_records_by_region')
+def allocated_ng_records_by_region(regions, years, combine, frequency = 'A', emissions = False):
+    # With frequency='M' every month of the years is allocated using that month's electricity sales,
+    # emissions adds the '<Sector> Electricity CO2' columns
+    ng_data = natural_gas_data_by_region(regions, frequency)
+    ng_data = ng_data[_in_years(ng_data.index.get_level_values('Date'), years, frequency)]
+    electricity_data = electricity_data_by_region(regions, frequency)
+    generation_mix = generation_mix_records_by_region(regions) if emissions else None
+    return allocate_ng_records(SectorTable.from_frame(ng_data), SectorTable.from_frame(electricity_data), combine,
+                               generation_mix)
+
+@instrumented('allocated_ng_data_by_region')
+def allocated_ng_data_by_region(regions, years, combine, frequency = 'A', emissions = False):
+    return allocated_ng_records_by_region(regions, years, combine, frequency, emissions).to_frame()
+
+def residential_energy_use_chart_job(dates, series, start_year, end_year, region : Region, save_folder = '../', frequency = 'A'):
+    # dates and {sector: values} as returned by SectorTable.series()
+    # Define a color map for the sectors, only the ones in series get plotted
+    color_map = {
+        'Residential': 'blue',
+        'Commercial': 'green',
+        'Industrial': 'red',
+        'Vehicle Fuel': 'purple',
+        'Other': 'orange'
+    }
+    series = {sector: series[sector] for sector in color_map if sector in series}
 
-    else:
-        all_years_df['Residential'].plot(kind='line', marker='o', color='blue', label='Residential')
     title = f'Residential Natural Gas Use Over Time in {print_region_string[region]}'  # Assuming Region is an enum with readable names
-    plt.title(title)
-    plt.xlabel('Year')
-    years = range(start_year, end_year + 1, 2)
-    plt.xticks(years)
-    plt.ylabel('(MMcf)')
-    plt.grid(True)
-    # plt.show()
-    
-    filepath = save_folder + title
-    plt.savefig(filepath, transparent=True)
+    years = list(range(start_year, end_year + 1, 2))
+    x = dates
+    if frequency == 'M':
+        # Months as fractional years, so the ticks stay on the years like the annual chart
+        title = f'Monthly Residential Natural Gas Use in {print_region_string[region]}'
+        x = [date.year + (date.month - 1) / 12 for date in x]
+    return LineChartJob(title, save_folder + title, x, series, color_map, years,
+                        'Year', '(MMcf)', (10, 5))
+
+@instrumented('residential_energy_use_over_time', 'region')
+def residential_energy_use_over_time(start_year, end_year, region : Region, save_folder = '../', show_all = False, frequency = 'A', dataset = None):
+    # dataset (an EnergyDataset) picks the sources, e.g. EnergyDataset().monthly(), its frequency wins over frequency
+    if dataset is None:
+        dataset = EnergyDataset(frequency=frequency)
+    frequency = dataset.frequency
+
+    # Only the residential data (or every sector) for the years gets loaded and allocated
+    sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other'] if show_all else ['Residential']
+    combined_ng_usage_records = dataset.region(region).years(range(start_year, end_year + 1)).sectors(sectors).allocated(True).collect()
+    dates, series = combined_ng_usage_records.series(region, sectors)
+
+    render_chart(residential_energy_use_chart_job(dates, series, start_year, end_year, region, save_folder, frequency))
+
+    return pd.DataFrame(series, index=pd.Index(dates, name='Year' if frequency == 'A' else 'Month'))
+
+def generation_mix_chart_job(dates, series, start_year, end_year, region : Region, save_folder = '../'):
+    # dates and {source: values} as returned by SectorTable.series(), only the ones in series get plotted
+    color_map = {
+        'Fossil Fuels': 'skyblue',
+        'Renewable': 'yellowgreen',
+        'Coal': 'black',
+        'Natural Gas': 'red',
+        'Petroluem': 'brown',
+        'Petroleum Coke': 'gray'
+    }
+    series = {source: series[source] for source in color_map if source in series}
 
-    return all_years_df
-    
+    title = f'Electricity Generation by Carbon Footprint Over Time in {print_region_string[region]}'
+    years = list(range(start_year, end_year + 1, 2))
+    return LineChartJob(title, save_folder + title, dates, series, color_map, years,
+                        'Year', '(thousand MWh)', (10, 5))
 
-Washington_NG_Data_Path = 'USEIA_Data/NG_CONS_SUM_DCU_SWA_A.csv'
-Oregon_NG_Data_Path = 'USEIA_Data/NG_CONS_SUM_DCU_SOR_A.csv'
-California_NG_Data_Path = 'USEIA_Data/NG_CONS_SUM_DCU_SCA_A.csv'
-US_NG_Data_Path = 'USEIA_Data/NG_CONS_SUM_DCU_NUS_A.csv'
-retail_sales_of_electricity_path = 'USEIA_Data/Retail_sales_of_electricity.csv'
-net_generation_for_all_sectors_path = 'USEIA_Data/Net_generation_for_all_sectors.csv'
-
-ng_data_path_dict = {
-    Region.WASHINGTON: 'USEIA_Data/NG_CONS_SUM_DCU_SWA_A.csv',
-    Region.OREGON: 'USEIA_Data/NG_CONS_SUM_DCU_SOR_A.csv',
-    Region.CALIFORNIA: 'USEIA_Data/NG_CONS_SUM_DCU_SCA_A.csv',
-    Region.UNITED_STATES: 'USEIA_Data/NG_CONS_SUM_DCU_NUS_A.csv'
-}
-electricity_data_region_string = {
-    Region.WASHINGTON: "Washington",
-    Region.OREGON: "Oregon",
-    Region.CALIFORNIA: "California",
-    Region.WEST_COAST: "Pacific Contiguous",
-    Region.UNITED_STATES: "United States"
-}
-print_region_string = {
-    Region.WASHINGTON: "Washington",
-    Region.OREGON: "Oregon",
-    Region.CALIFORNIA: "California",
-    Region.WEST_COAST: "The West Coast",
-    Region.UNITED_STATES: "The United States"
-}
+@instrumented('generation_mix_over_time', 'region')
+def generation_mix_over_time(start_year, end_year, region : Region, save_folder = '../', show_all = False):
+    # Fossil Fuels vs Renewable generation (and each fossil fuel with show_all) for the years,
+    # returned along with the carbon intensity
+    generation_mix = generation_mix_records_by_region([region])
+    generation_mix = generation_mix.subset(_in_years(generation_mix.index.get_level_values('Date'), range(start_year, end_year + 1), 'A'))
+    sources = ['Fossil Fuels', 'Renewable'] + (fossil_fuels_sources if show_all else [])
+    dates, series = generation_mix.series(region, sources + ['Carbon Intensity'])
 
-if __name__ == "__main__":
+    render_chart(generation_mix_chart_job(dates, series, start_year, end_year, region, save_folder))
 
-    year_of_interest = 2016
+    return pd.DataFrame(series, index=pd.Index(dates, name='Year'))
+    
 
-    read_in_ng_data = False
-    read_in_electrival_usage = False
-    read_in_electrical_generation = False
-    plot_data_over_years = True
+data_folder = 'USEIA_Data'
 
-    show = False
+Washington_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SWA_A.csv'
+Oregon_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SOR_A.csv'
+California_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SCA_A.csv'
+US_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_NUS_A.csv'
+retail_sales_of_electricity_path = f'{data_folder}/Retail_sales_of_electricity.csv'
+net_generation_for_all_sectors_path = f'{data_folder}/Net_generation_for_all_sectors.csv'
+# freq=M exports of the same browser queries, the monthly natural gas files sit next to the annual ones
+retail_sales_of_electricity_monthly_path = f'{data_folder}/Retail_sales_of_electricity_monthly.csv'
 
-    save_folder = f'../{year_of_interest}/'
+# Every region with its own natural gas file, composite regions are summed from these
+ng_data_path_dict = {region: natural_gas_data_path(region, data_folder)
+                     for region, info in region_registry.items() if info.natural_gas_code}
+electricity_data_region_string = {region: info.electricity_name for region, info in region_registry.items()}
+print_region_string = {region: info.print_name for region, info in region_registry.items()}
 
-    if not os.path.exists(save_folder):
-        os.makedirs(save_folder)
+pie_chart_region_string = {
+    Region.WASHINGTON: "Washington",
+    Region.OREGON: "Oregon",
+    Region.CALIFORNIA: "California",
+    Region.WEST_COAST: "the West Coast",
+    Region.UNITED_STATES: "The United States"
+}
 
-    if (read_in_ng_data):
-        washington_data_2022 = parse_natural_gas_data_for_state_at_year(Washington_NG_Data_Path, year_of_interest) 
-        oregon_data_2022 = parse_natural_gas_data_for_state_at_year(Oregon_NG_Data_Path, year_of_interest)
-        california_data_2022 = parse_natural_gas_data_for_state_at_year(California_NG_Data_Path, year_of_interest)
-        west_coast_data_2022 = combine_state_ng_data([washington_data_2022, oregon_data_2022, california_data_2022])
-        us_data_2022 = parse_natural_gas_data_for_state_at_year(US_NG_Data_Path, year_of_interest)
+def set_data_folder(folder):
+    # Point every source path at another copy of USEIA_Data/
+    global data_folder, retail_sales_of_electricity_path, net_generation_for_all_sectors_path
+    global retail_sales_of_electricity_monthly_path
+    global Washington_NG_Data_Path, Oregon_NG_Data_Path, California_NG_Data_Path, US_NG_Data_Path
+    data_folder = folder
+    Washington_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SWA_A.csv'
+    Oregon_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SOR_A.csv'
+    California_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_SCA_A.csv'
+    US_NG_Data_Path = f'{data_folder}/NG_CONS_SUM_DCU_NUS_A.csv'
+    retail_sales_of_electricity_path = f'{data_folder}/Retail_sales_of_electricity.csv'
+    net_generation_for_all_sectors_path = f'{data_folder}/Net_generation_for_all_sectors.csv'
+    retail_sales_of_electricity_monthly_path = f'{data_folder}/Retail_sales_of_electricity_monthly.csv'
+    ng_data_path_dict.update({region: natural_gas_data_path(region, data_folder) for region in ng_data_path_dict})
+
+chart_types = ['natural-gas', 'electricity', 'combined', 'combined-split', 'generation', 'over-time', 'over-time-monthly',
+               'generation-over-time']
+
+def chart_sources(charts, regions):
+    # (kind, path) of every file build_chart_jobs loads whole for these charts and regions,
+    # the monthly over time charts read their slice through an EnergyDataset instead
+    charts = set(charts)
+    sources = []
+    if charts & {'natural-gas', 'combined', 'combined-split', 'over-time'}:
+        states = {source for region in regions for source in natural_gas_source_regions(region)}
+        sources += [('natural_gas', ng_data_path_dict[state]) for state in sorted(states, key=lambda state: state.name)]
+    if charts & {'electricity', 'combined', 'combined-split', 'over-time'}:
+        sources.append(('electricity_sales', retail_sales_of_electricity_path))
+    if charts & {'generation', 'generation-over-time'}:
+        sources.append(('electricity_generation', net_generation_for_all_sectors_path))
+    return sources
+
+# The source kinds each chart type reads
+chart_source_kinds = {
+    'natural-gas': ['natural_gas'],
+    'electricity': ['electricity_sales'],
+    'combined': ['natural_gas', 'electricity_sales'],
+    'combined-split': ['natural_gas', 'electricity_sales'],
+    'generation': ['electricity_generation'],
+    'over-time': ['natural_gas', 'electricity_sales'],
+    'over-time-monthly': ['natural_gas_monthly', 'electricity_sales_monthly'],
+    'generation-over-time': ['electricity_generation'],
+}
 
-        make_pie_chart_of_natural_gas_data(washington_data_2022, "Washington", year_of_interest, save_folder)
-        make_pie_chart_of_natural_gas_data(oregon_data_2022, "Oregon", year_of_interest, save_folder)
-        make_pie_chart_of_natural_gas_data(california_data_2022, "California", year_of_interest, save_folder)
-        make_pie_chart_of_natural_gas_data(west_coast_data_2022, 'the West Coast', year_of_interest, save_folder)
-        make_pie_chart_of_natural_gas_data(us_data_2022, "The United States", year_of_interest, save_folder)
-    
-    if (read_in_electrival_usage):
-        washington_electricity_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year_of_interest, 'Washington')
-        oregon_electricity_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year_of_interest, "Oregon")
-        california_electricity_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year_of_interest, "California")
-        west_coast_electricity_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year_of_interest, "Pacific Contiguous")
-        united_states_electricity_data = parse_electricity_data_by_sector(retail_sales_of_electricity_path, year_of_interest, "United States")
-
-        make_pie_chart_of_electrical_data(washington_electricity_data, 'Washington', year_of_interest, save_folder)
-        make_pie_chart_of_electrical_data(oregon_electricity_data, "Oregon", year_of_interest, save_folder)
-        make_pie_chart_of_electrical_data(california_electricity_data, "California", year_of_interest, save_folder)
-        make_pie_chart_of_electrical_data(west_coast_electricity_data, 'the West Coast', year_of_interest, save_folder)
-        make_pie_chart_of_electrical_data(united_states_electricity_data, "The United States", year_of_interest, save_folder)
-
-    if (read_in_electrical_generation):
-        washington_electrical_generation_data = parse_electricity_generation_data_carbon(net_generation_for_all_sectors_path, year_of_interest, 'Washington')
-        washington_electrical_generation_data = calculate_renewable_vs_fossil(washington_electrical_generation_data)
-        make_pie_chart_of_electrical_source_data(washington_electrical_generation_data, "Washington", year_of_interest)
-
-    if (read_in_ng_data and read_in_electrival_usage):
-        combine = True
-
-        combined_data_washington = allocate_ng_to_electricity_sectors(washington_data_2022, washington_electricity_data, combine)
-        combined_data_oregon = allocate_ng_to_electricity_sectors(oregon_data_2022, oregon_electricity_data, combine)
-        combined_data_california = allocate_ng_to_electricity_sectors(california_data_2022, california_electricity_data, combine)
-        combined_data_west_coast = allocate_ng_to_electricity_sectors(west_coast_data_2022, west_coast_electricity_data, combine)
-        combined_data_us = allocate_ng_to_electricity_sectors(us_data_2022, united_states_electricity_data, combine)
-
-        make_pie_chart_of_combined_data(combined_data_washington, "Washington", year_of_interest, save_folder, combine)
-        make_pie_chart_of_combined_data(combined_data_oregon, "Oregon", year_of_interest, save_folder, combine)
-        make_pie_chart_of_combined_data(combined_data_california, "California", year_of_interest, save_folder, combine)
-        make_pie_chart_of_combined_data(combined_data_west_coast, "the West Coast", year_of_interest, save_folder, combine)
-        make_pie_chart_of_combined_data(combined_data_us, "The United States", year_of_interest, save_folder, combine)
-
-    if (plot_data_over_years):
-        residential_energy_use_over_time(2002, 2023, Region.WASHINGTON)
-        residential_energy_use_over_time(2002, 2023, Region.OREGON)
-        residential_energy_use_over_time(2002, 2023, Region.CALIFORNIA)
-        residential_energy_use_over_time(2002, 2023, Region.WEST_COAST)
-        residential_energy_use_over_time(2002, 2023, Region.UNITED_STATES)
-        
-        
-    
+def regions_without_data(regions, kinds):
+    # The regions some of the source kinds has no rows for: natural gas files missing from
+    # the data folder, or locations neither published in a browser export nor summable from members
+    browser_sources = {'electricity_sales': (electricity_sales_index, retail_sales_of_electricity_path),
+                       'electricity_sales_monthly': (electricity_sales_monthly_index, retail_sales_of_electricity_monthly_path),
+                       'electricity_generation': (electricity_generation_index, net_generation_for_all_sectors_path)}
+    published = {}
+    for kind in set(kinds) & set(browser_sources):
+        load_index, path = browser_sources[kind]
+        published[kind] = set(load_index(path).regions()) if os.path.exists(path) else set()
+
+    missing = []
+    for region in regions:
+        for kind in kinds:
+            if kind in published:
+                present = has_electricity_data(region, published[kind])
+            else:
+                present = has_natural_gas_data(region, data_folder, 'M' if kind == 'natural_gas_monthly' else 'A')
+            if not present:
+                missing.append(region)
+                break
+    return missing
+
+def _check_chart_regions(charts, regions):
+    kinds = {kind for chart in charts for kind in chart_source_kinds[chart]}
+    missing = regions_without_data(regions, sorted(kinds))
+    if missing:
+        raise ValueError(f'No data for {", ".join(region.name for region in missing)}')
+
+def _chart_tables(charts, regions):
+    # {table name: SectorTable} of every table the charts need, each built once and shared
+    # by every chart type that needs it; pie charts use the table named like them
+    tables = {}
+    allocated_charts = {'combined', 'combined-split', 'over-time'}
+    if charts & ({'natural-gas'} | allocated_charts):
+        tables['natural-gas'] = SectorTable.from_frame(natural_gas_data_by_region(regions))
+    if charts & ({'electricity'} | allocated_charts):
+        tables['electricity'] = SectorTable.from_frame(electricity_data_by_region(regions))
+    if charts & {'combined', 'over-time'}:
+        tables['combined'] = allocate_ng_records(tables['natural-gas'], tables['electricity'], True)
+    if 'combined-split' in charts:
+        tables['combined-split'] = allocate_ng_records(tables['natural-gas'], tables['electricity'], False)
+    if charts & {'generation', 'generation-over-time'}:
+        tables['generation'] = generation_mix_records_by_region(regions)
+    return tables
+
+pie_chart_job_builders = {
+    'natural-gas': natural_gas_pie_chart_job,
+    'electricity': electrical_pie_chart_job,
+    'combined': lambda record, location, year, folder: combined_pie_chart_job(record, location, year, folder, True),
+    'combined-split': lambda record, location, year, folder: combined_pie_chart_job(record, location, year, folder, False),
+    'generation': electrical_source_pie_chart_job,
+}
 
-    
-    
+def _pie_chart_jobs(tables, charts, regions, years, output_folder, make_folders = True):
+    # {(chart, region, year): job} of the pie charts, in the order they are rendered
+    missing = [year for year in years if any((region, year) not in tables[chart].positions()
+                                             for chart in charts if chart in pie_chart_job_builders for region in regions)]
+    if missing:
+        raise ValueError(f'No data for {", ".join(map(str, missing))} for some of the selected regions')
+
+    jobs = {}
+    for year_of_interest in years:
+        save_folder = os.path.join(output_folder, str(year_of_interest)) + os.sep
+
+        if make_folders and not os.path.exists(save_folder):
+            os.makedirs(save_folder)
+
+        for region in regions:
+            location_name = pie_chart_region_string.get(region, print_region_string[region])
+            key = (region, year_of_interest)
+            for chart, build_job in pie_chart_job_builders.items():
+                if chart in charts:
+                    jobs[(chart, region, year_of_interest)] = build_job(tables[chart].record(key), location_name,
+                                                                        year_of_interest, save_folder)
+    return jobs
+
+def build_chart_jobs(charts, regions, years, output_folder = '..', over_time_years = (2002, 2023), show_all = False):
+    # Every region and year is parsed/allocated in one batch into SectorTables, each chart
+    # takes its region-year record from those and becomes a job to render later
+    charts = set(charts)
+    regions = list(regions)
+    years = list(years)
+    _check_chart_regions(charts, regions)
+
+    # Source files not loaded yet are read and parsed concurrently up front
+    ingest_sources(chart_sources(charts, regions))
+
+    tables = _chart_tables(charts, regions)
+    chart_jobs = list(_pie_chart_jobs(tables, charts, regions, years, output_folder).values())
+
+    sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other'] if show_all else ['Residential']
+    start_year, end_year = over_time_years
+    for chart, frequency in (('over-time', 'A'), ('over-time-monthly', 'M')):
+        if chart in charts:
+            if frequency == 'A':
+                dates = tables['combined'].index.get_level_values('Date')
+                usage_records = tables['combined'].subset(_in_years(dates, range(start_year, end_year + 1), frequency))
+            else:
+                usage_records = EnergyDataset(frequency=frequency).region(regions).years(range(start_year, end_year + 1)) \
+                    .sectors(sectors).allocated(True).collect()
+            for region in regions:
+                dates, series = usage_records.series(region, sectors)
+                chart_jobs.append(residential_energy_use_chart_job(dates, series, start_year, end_year, region,
+                                                                   output_folder + os.sep, frequency))
+
+    if 'generation-over-time' in charts:
+        sources = ['Fossil Fuels', 'Renewable'] + (fossil_fuels_sources if show_all else [])
+        dates = tables['generation'].index.get_level_values('Date')
+        generation_over_time = tables['generation'].subset(_in_years(dates, range(start_year, end_year + 1), 'A'))
+        for region in regions:
+            dates, series = generation_over_time.series(region, sources)
+            chart_jobs.append(generation_mix_chart_job(dates, series, start_year, end_year, region, output_folder + os.sep))
+
+    return chart_jobs
+
+pie_chart_types = list(pie_chart_job_builders)
+atlas_layouts = ['year', 'region']
+atlas_formats = ['png', 'svg', 'pdf']
+
+def build_atlas_jobs(charts, regions, years, output_folder = '..', by = 'year', file_format = 'png', cell_size = (6, 5)):
+    # The pie charts as AtlasJobs, one canvas per year (a row per region) or per region
+    # (a row per year), with a column per chart type. Only the atlas files are written,
+    # not the per-year folders of build_chart_jobs
+    if by not in atlas_layouts:
+        raise ValueError(f'by must be one of {", ".join(atlas_layouts)}')
+    charts = [chart for chart in pie_chart_types if chart in set(charts)]
+    regions = list(regions)
+    years = list(years)
+    _check_chart_regions(charts, regions)
+
+    ingest_sources(chart_sources(charts, regions))
+    jobs = _pie_chart_jobs(_chart_tables(set(charts), regions), charts, regions, years, output_folder, False)
+
+    atlases = []
+    if by == 'year':
+        for year in years:
+            title = f'Natural Gas and Electricity by Sector ({year})'
+            rows = [[jobs[(chart, region, year)] for chart in charts] for region in regions]
+            atlases.append(AtlasJob(title, os.path.join(output_folder, f'{title}.{file_format}'), rows, cell_size))
+    else:
+        for region in regions:
+            title = f'Natural Gas and Electricity by Sector in {print_region_string[region]} ({years[0]}-{years[-1]})'
+            rows = [[jobs[(chart, region, year)] for chart in charts] for year in years]
+            atlases.append(AtlasJob(title, os.path.join(output_folder, f'{title}.{file_format}'), rows, cell_size))
+    return atlases
+
+@instrumented('make_chart_atlas')
+def make_chart_atlas(charts, regions, years, output_folder = '..', by = 'year', file_format = 'png',
+                     max_workers = None, incremental = False):
+    # Returns the written paths: one PNG/SVG per atlas, or a single PDF with an atlas per page
+    atlases = build_atlas_jobs(charts, regions, years, output_folder, by, file_format)
+    if file_format == 'pdf':
+        atlases = [AtlasBookJob(os.path.join(output_folder, f'Natural Gas and Electricity by Sector by {by}.pdf'), atlases)]
+    return render_charts(atlases, max_workers, incremental=incremental)
 
+if __name__ == "__main__":
+    import sys
+    from eia_cli import main
 
+    # Without arguments this draws the residential use over time charts, see --help
+    sys.exit(main(sys.argv[1:] or ['charts']))
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+# Renders a long batch of pie and line charts and samples the process' resident
+# memory along the way, once per figure lifecycle:
+#   pyplot - the old way, plt.figure() per chart and never closed
+#   figure - a fresh object-oriented Figure per chart (render_chart default)
+#   reuse  - one reused Figure per chart type (render_charts default)
+# Each mode runs in its own process so their peaks do not mix. The bounded modes
+# should finish with about the same RSS they had after the first few charts.
+#
+#   python benchmarks/bench_figure_memory.py --charts 300
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+modes = ['pyplot', 'figure', 'reuse']
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        # Not Linux, fall back to the peak
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def synthetic_jobs(count, output_folder):
+    from chart_rendering import PieChartJob, LineChartJob
+
+    colors = ['skyblue', 'yellowgreen', 'coral', 'gold', 'lightpink']
+    labels = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
+    for index in range(count):
+        file_path = os.path.join(output_folder, f'chart {index % 10}')
+        if index % 4 == 3:
+            years = list(range(2002, 2024))
+            series = {label: [(index + year) % 97 + position for year in years]
+                      for position, label in enumerate(labels)}
+            yield LineChartJob(f'Line {index}', file_path, years, series, dict(zip(labels, colors)),
+                               years[::2], 'Year', '(MMcf)', (10, 5))
+        else:
+            values = [(index * (position + 3)) % 50 + 5 for position in range(5)]
+            yield PieChartJob(f'Pie {index}', file_path, values, labels, colors, (10, 8))
+
+
+def run_mode(mode, charts, samples):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import chart_rendering
+
+    rss = []
+    sample_every = max(1, charts // samples)
+    with tempfile.TemporaryDirectory() as output_folder:
+        for index, job in enumerate(synthetic_jobs(charts, output_folder)):
+            if mode == 'pyplot':
+                fig = plt.figure(figsize=job.figsize)
+                chart_rendering._draw(fig, job)
+                fig.savefig(job.file_path, transparent=True)
+            else:
+                chart_rendering.render_chart(job, reuse_figure=(mode == 'reuse'))
+            if (index + 1) % sample_every == 0:
+                rss.append(round(current_rss_mb(), 1))
+    return {'mode': mode, 'charts': charts, 'rss_mb': rss, 'peak_rss_mb': round(peak_rss_mb(), 1),
+            'open_pyplot_figures': len(plt.get_fignums())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of long chart batches per figure lifecycle')
+    parser.add_argument('--charts', type=int, default=300)
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--mode', choices=modes, help='run a single mode in this process')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--max-growth-mb', type=float, default=25.0,
+                        help='fail if a bounded mode grows more than this after its first sample')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.charts, args.samples)))
+        return 0
+
+    results = []
+    for mode in modes:
+        completed = subprocess.run([sys.executable, __file__, '--mode', mode, '--charts', str(args.charts),
+                                    '--samples', str(args.samples)],
+                                   check=True, capture_output=True, text=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    failed = False
+    print(f'{"mode":<8} {"charts":>6} {"first RSS":>10} {"last RSS":>10} {"growth":>8} {"peak":>8}')
+    for result in results:
+        growth = result['rss_mb'][-1] - result['rss_mb'][0]
+        result['growth_mb'] = round(growth, 1)
+        print(f'{result["mode"]:<8} {result["charts"]:>6} {result["rss_mb"][0]:>8.1f}MB {result["rss_mb"][-1]:>8.1f}MB'
+              f' {growth:>6.1f}MB {result["peak_rss_mb"]:>6.1f}MB')
+        if result['mode'] != 'pyplot' and growth > args.max_growth_mb:
+            failed = True
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Times every stage of the parse -> allocate -> render pipeline against synthetic
+# EIA-shaped CSVs (see synthetic_eia_data.py), fully offline. Each stage reports wall
+# time, calls, time per call, peak traced memory and, for render stages, figures/sec;
+# a stage can also report other counts (e.g. scenarios) with their rate.
+# Results are written as JSON; pass a previous result with --baseline to flag stages
+# that got slower.
+#
+#   python benchmarks/bench_pipeline.py --states 10 --years 22 --output before.json
+#   python benchmarks/bench_pipeline.py --states 10 --years 22 --baseline before.json
+
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmarks_folder))
+sys.path.insert(0, benchmarks_folder)
+
+
+def build_stages(pipeline, states, years, render_years, output_folder):
+    import eia_data_loader
+    from regions import Region
+
+    ng_paths = [pipeline.ng_data_path_dict[state] for state in states]
+    electricity_names = [pipeline.electricity_data_region_string[state] for state in states]
+    sales_path = pipeline.retail_sales_of_electricity_path
+    generation_path = pipeline.net_generation_for_all_sectors_path
+    save_folder = output_folder + os.sep
+    series_regions = states + [Region.WEST_COAST, Region.UNITED_STATES]
+
+    def parse_natural_gas_cold():
+        eia_data_loader.clear_table_cache()
+        for path in ng_paths:
+            pipeline.parse_natural_gas_data_for_state_at_year(path, years[0])
+        return len(ng_paths), 0
+
+    def parse_natural_gas():
+        for path in ng_paths:
+            for year in years:
+                pipeline.parse_natural_gas_data_for_state_at_year(path, year)
+        return len(ng_paths) * len(years), 0
+
+    def parse_electricity_cold():
+        eia_data_loader.clear_table_cache()
+        pipeline.parse_electricity_data_by_sector(sales_path, years[0], electricity_names[0])
+        return 1, 0
+
+    def parse_electricity():
+        for name in electricity_names:
+            for year in years:
+                pipeline.parse_electricity_data_by_sector(sales_path, year, name)
+        return len(electricity_names) * len(years), 0
+
+    def combine():
+        for year in years:
+            pipeline.combine_state_ng_data([pipeline.parse_natural_gas_data_for_state_at_year(path, year)
+                                            for path in ng_paths])
+        return len(years), 0
+
+    def allocate():
+        calls = 0
+        for path, name in zip(ng_paths, electricity_names):
+            for year in years:
+                ng_data = pipeline.parse_natural_gas_data_for_state_at_year(path, year)
+                electricity_data = pipeline.parse_electricity_data_by_sector(sales_path, year, name)
+                pipeline.allocate_ng_to_electricity_sectors(ng_data, electricity_data, True)
+                calls += 1
+        return calls, 0
+
+    def allocate_batch():
+        pipeline.allocated_ng_data_by_region(series_regions, years, True)
+        pipeline.allocated_ng_data_by_region(series_regions, years, False)
+        return 2, 0
+
+    def ingest_cold():
+        # Every source file of the folder, parsed concurrently
+        eia_data_loader.clear_table_cache()
+        sources = eia_data_loader.discover_sources(pipeline.data_folder)
+        eia_data_loader.ingest_sources(sources)
+        return len(sources), 0
+
+    def dataset_slice_cold():
+        # Residential use of a few recent years, only that slice is read from the files
+        from energy_dataset import EnergyDataset
+        eia_data_loader.clear_table_cache()
+        EnergyDataset().region(series_regions).years(years[-3:]).sectors('Residential').allocated().collect()
+        return 1, 0
+
+    scenario_baseline = {}
+
+    def load_baseline():
+        # Kept for scenario_sweep, so that stage times the scenario math alone
+        import electrification_scenarios
+        scenario_baseline['baseline'] = electrification_scenarios.load_baseline(series_regions, years)
+        return 1, 0
+
+    def scenario_sweep():
+        # 10,000 electrification scenarios over every series region and year in one broadcast
+        import numpy as np
+        import electrification_scenarios
+        grid = electrification_scenarios.scenario_grid(residential_share=np.linspace(0, 1, 25),
+                                                       heat_pump_cop=np.linspace(2, 4, 20),
+                                                       renewable_share_change=np.linspace(0, 0.5, 20))
+        result = electrification_scenarios.evaluate_scenarios(scenario_baseline['baseline'], **grid)
+        return 1, 0, {'scenarios': len(result.values)}
+
+    def chart_jobs():
+        # Every pie chart and over time job for every region-year, built from the batch SectorTables
+        jobs = pipeline.build_chart_jobs(pipeline.chart_types[:6], series_regions, years, output_folder,
+                                         (years[0], years[-1]), True)
+        return len(jobs), 0
+
+    atlas_charts = ['natural-gas', 'electricity', 'combined', 'generation']
+
+    def pie_chart_files():
+        # The same charts as atlas_by_year, one file each
+        from chart_rendering import render_charts
+        jobs = pipeline.build_chart_jobs(atlas_charts, states, render_years, output_folder)
+        render_charts(jobs, max_workers=1)
+        return len(jobs), len(jobs)
+
+    def atlas_by_year():
+        rendered = pipeline.make_chart_atlas(atlas_charts, states, render_years, output_folder, 'year', max_workers=1)
+        return len(rendered), len(rendered)
+
+    def pie_charts(make_chart, load):
+        def stage():
+            calls = 0
+            for path, name, state in zip(ng_paths, electricity_names, states):
+                for year in render_years:
+                    make_chart(load(path, name, year), state.value, year, save_folder)
+                    calls += 1
+            return calls, calls
+        return stage
+
+    def natural_gas_data(path, name, year):
+        return pipeline.parse_natural_gas_data_for_state_at_year(path, year)
+
+    def electricity_data(path, name, year):
+        return pipeline.parse_electricity_data_by_sector(sales_path, year, name)
+
+    def combined_data(path, name, year):
+        return pipeline.allocate_ng_to_electricity_sectors(natural_gas_data(path, name, year),
+                                                           electricity_data(path, name, year), True)
+
+    def generation_data(path, name, year):
+        return pipeline.calculate_renewable_vs_fossil(
+            pipeline.parse_electricity_generation_data_carbon(generation_path, year, name))
+
+    def residential_energy_use_over_time():
+        for region in series_regions:
+            pipeline.residential_energy_use_over_time(years[0], years[-1], region, save_folder, show_all=True)
+        return len(series_regions), len(series_regions)
+
+    return [
+        ('parse_natural_gas_data_for_state_at_year (cold)', parse_natural_gas_cold),
+        ('parse_natural_gas_data_for_state_at_year', parse_natural_gas),
+        ('parse_electricity_data_by_sector (cold)', parse_electricity_cold),
+        ('parse_electricity_data_by_sector', parse_electricity),
+        ('combine_state_ng_data', combine),
+        ('allocate_ng_to_electricity_sectors', allocate),
+        ('allocate_ng_to_electricity_sectors_batch', allocate_batch),
+        ('ingest_sources (cold)', ingest_cold),
+        ('EnergyDataset.collect (cold)', dataset_slice_cold),
+        ('load_baseline', load_baseline),
+        ('evaluate_scenarios', scenario_sweep),
+        ('build_chart_jobs', chart_jobs),
+        ('make_pie_chart_of_natural_gas_data', pie_charts(pipeline.make_pie_chart_of_natural_gas_data, natural_gas_data)),
+        ('make_pie_chart_of_electrical_data', pie_charts(pipeline.make_pie_chart_of_electrical_data, electricity_data)),
+        ('make_pie_chart_of_combined_data', pie_charts(pipeline.make_pie_chart_of_combined_data, combined_data)),
+        ('make_pie_chart_of_electrical_source_data',
+         pie_charts(pipeline.make_pie_chart_of_electrical_source_data, generation_data)),
+        ('residential_energy_use_over_time', residential_energy_use_over_time),
+        ('render_charts (pie charts, one file each)', pie_chart_files),
+        ('make_chart_atlas (by year)', atlas_by_year),
+    ]
+
+
+def run_stage(name, stage, repeat, trace_memory):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        calls, figures, *other_counts = stage()
+        timings.append(time.perf_counter() - start)
+    wall = min(timings)
+
+    peak_mb = None
+    if trace_memory:
+        # Separate pass, tracemalloc slows everything down too much to time under it
+        tracemalloc.start()
+        stage()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    result = {
+        'stage': name,
+        'calls': calls,
+        'wall_s': round(wall, 6),
+        'per_call_ms': round(wall / calls * 1000, 4) if calls else None,
+        'peak_mb': round(peak_mb, 3) if peak_mb is not None else None,
+        'figures_per_s': round(figures / wall, 3) if figures else None,
+    }
+    # Counts of other things than calls and figures, e.g. {'scenarios': 10000}
+    result['counts'] = other_counts[0] if other_counts else {}
+    for count_name, value in result['counts'].items():
+        result[f'{count_name}_per_s'] = round(value / wall, 3)
+    return result
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = {stage['stage']: stage for stage in json.load(baseline_file)['stages']}
+    regressions = []
+    for result in results:
+        before = baseline.get(result['stage'])
+        if before is None or not before['wall_s']:
+            continue
+        result['vs_baseline'] = round(result['wall_s'] / before['wall_s'], 3)
+        if result['vs_baseline'] > 1 + tolerance:
+            regressions.append(result['stage'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parse -> allocate -> render pipeline')
+    parser.add_argument('--states', type=int, default=3)
+    parser.add_argument('--years', type=int, default=22)
+    parser.add_argument('--sectors', type=int, default=0, help='extra sectors/sources per file')
+    parser.add_argument('--render-years', type=int, default=1, help='years of pie charts to render per state')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the fastest one is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--disk-cache', action='store_true', help='let the loader use the on-disk table cache')
+    parser.add_argument('--output', default='bench_pipeline.json')
+    parser.add_argument('--baseline', help='previous result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown vs the baseline')
+    args = parser.parse_args()
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import pandas as pd
+
+    from synthetic_eia_data import write_synthetic_eia_data
+
+    with tempfile.TemporaryDirectory() as work_folder:
+        states, years = write_synthetic_eia_data(work_folder, args.states, args.years, args.sectors)
+        output_folder = os.path.join(work_folder, 'charts')
+        os.makedirs(output_folder)
+
+        # The pipeline resolves USEIA_Data/ against the working directory
+        previous_folder = os.getcwd()
+        os.chdir(work_folder)
+        try:
+            import eia_data_loader
+            import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+
+            eia_data_loader.use_disk_cache = args.disk_cache
+            stages = build_stages(pipeline, states, years, years[-args.render_years:], output_folder)
+            results = [run_stage(name, stage, args.repeat, not args.no_memory) for name, stage in stages]
+        finally:
+            os.chdir(previous_folder)
+
+    regressions = compare_to_baseline(results, args.baseline, args.tolerance) if args.baseline else []
+
+    print(f'{"stage":<50} {"calls":>6} {"wall s":>9} {"ms/call":>9} {"peak MB":>8} {"fig/s":>7}')
+    for result in results:
+        print(f'{result["stage"]:<50} {result["calls"]:>6} {result["wall_s"]:>9.4f} '
+              f'{result["per_call_ms"] or 0:>9.3f} {result["peak_mb"] or 0:>8.2f} {result["figures_per_s"] or 0:>7.2f}'
+              + (f'  x{result["vs_baseline"]:.2f}' if 'vs_baseline' in result else '')
+              + ''.join(f'  {value} {count_name}' for count_name, value in result['counts'].items()))
+
+    report = {
+        'config': {'states': len(states), 'years': len(years), 'sectors': args.sectors,
+                   'render_years': args.render_years, 'repeat': args.repeat, 'disk_cache': args.disk_cache},
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'matplotlib': matplotlib.__version__, 'cpus': os.cpu_count(), 'platform': platform.platform()},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': results,
+        'regressions': regressions,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+
+    if regressions:
+        print('Slower than baseline: ' + ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+# Load test for the query service (eia_service.py). Without --url it writes synthetic
+# EIA data (see synthetic_eia_data.py), starts `eia_cli.py serve` on it and runs
+# against that. Each client keeps one HTTP/1.1 connection open and sends queries
+# drawn from a fixed pool, so the share of repeats (and LRU hits) is set by --distinct.
+#
+#   python benchmarks/load_test_service.py --clients 16 --requests 20000
+#   python benchmarks/load_test_service.py --url http://127.0.0.1:8765 --distinct 5000
+
+benchmarks_folder = os.path.dirname(os.path.abspath(__file__))
+package_folder = os.path.dirname(benchmarks_folder)
+sys.path.insert(0, benchmarks_folder)
+
+
+async def request(reader, writer, host, target):
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    return status, headers, body
+
+
+def query_pool(regions, years, distinct, seed):
+    rng = random.Random(seed)
+    datasets = ['allocated', 'natural-gas', 'electricity']
+    pool = []
+    for _ in range(distinct):
+        first = rng.choice(years)
+        last = rng.choice([year for year in years if year >= first])
+        chosen = rng.sample(regions, rng.randint(1, min(3, len(regions))))
+        target = (f'/query?dataset={rng.choice(datasets)}&regions={",".join(chosen)}&years={first}-{last}'
+                  f'&shares={rng.randint(0, 1)}&combine={rng.randint(0, 1)}')
+        pool.append(target)
+    return pool
+
+
+async def client(host, port, pool, count, seed, latencies, server_times, errors):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            status, headers, _ = await request(reader, writer, host, rng.choice(pool))
+            latencies.append(time.perf_counter() - started)
+            server_times.append(float(headers.get('x-query-time-us', 0)))
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def get_json(host, port, target):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, _, body = await request(reader, writer, host, target)
+    finally:
+        writer.close()
+    return json.loads(body)
+
+
+async def wait_for_service(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await get_json(host, port, '/regions')
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args, host, port):
+    regions = await wait_for_service(host, port, args.startup_timeout)
+    pool = query_pool([region['name'] for region in regions['regions']], regions['years'], args.distinct, args.seed)
+
+    latencies, server_times, errors = [], [], []
+    per_client = args.requests // args.clients
+    started = time.perf_counter()
+    await asyncio.gather(*(client(host, port, pool, per_client, args.seed + index, latencies, server_times, errors)
+                           for index in range(args.clients)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    server_times.sort()
+    cache = (await get_json(host, port, '/health'))['cache']
+    report = {
+        'clients': args.clients, 'requests': len(latencies), 'distinct_queries': len(set(pool)), 'errors': len(errors),
+        'wall_s': round(wall, 3), 'requests_per_s': round(len(latencies) / wall, 1),
+        'latency_ms': {'p50': round(percentile(latencies, 0.5) * 1000, 3),
+                       'p95': round(percentile(latencies, 0.95) * 1000, 3),
+                       'p99': round(percentile(latencies, 0.99) * 1000, 3),
+                       'mean': round(statistics.fmean(latencies) * 1000, 3)},
+        'server_us': {'p50': percentile(server_times, 0.5), 'p99': percentile(server_times, 0.99)},
+        'cache': cache,
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the local query service')
+    parser.add_argument('--url', help='running service to test, e.g. http://127.0.0.1:8765 (default: start one)')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive connections')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--distinct', type=int, default=200, help='size of the query pool requests are drawn from')
+    parser.add_argument('--states', type=int, default=10, help='synthetic data: states')
+    parser.add_argument('--years', type=int, default=22, help='synthetic data: years')
+    parser.add_argument('--port', type=int, default=8799, help='port of the service started here')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--output', help='write the report as JSON here')
+    args = parser.parse_args()
+
+    if args.url:
+        url = urlsplit(args.url)
+        report = asyncio.run(run(args, url.hostname, url.port or 80))
+    else:
+        from synthetic_eia_data import write_synthetic_eia_data
+
+        with tempfile.TemporaryDirectory() as work_folder:
+            write_synthetic_eia_data(work_folder, args.states, args.years)
+            service = subprocess.Popen([sys.executable, os.path.join(package_folder, 'eia_cli.py'),
+                                        '--data-dir', os.path.join(work_folder, 'USEIA_Data'),
+                                        'serve', '--port', str(args.port)])
+            try:
+                report = asyncio.run(run(args, '127.0.0.1', args.port))
+            finally:
+                service.terminate()
+                service.wait()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
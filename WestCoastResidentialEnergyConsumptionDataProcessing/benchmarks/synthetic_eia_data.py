@@ -0,0 +1,118 @@
+import calendar
+import os
+import random
+import sys
+
+# Writes a USEIA_Data/ folder of synthetic files shaped like the real EIA downloads:
+# one NG_CONS_SUM_DCU_S??_A.csv per state (plus the national NUS file), and the
+# Retail_sales_of_electricity.csv / Net_generation_for_all_sectors.csv browser exports
+# with a row per location and sector/source. Washington, Oregon and California are
+# always included so the West Coast can be built. With months, the monthly _M natural
+# gas files and Retail_sales_of_electricity_monthly.csv are written too, covering that
+# many months up to the end of last_year.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from regions import Region, region_registry, state_regions
+
+retail_sectors = ['all sectors', 'residential', 'commercial', 'industrial', 'transportation', 'other']
+generation_sources = ['all fuels (utility-scale)', 'coal', 'petroleum liquids', 'petroleum coke', 'natural gas',
+                      'other gases', 'nuclear', 'conventional hydroelectric', 'wind', 'all utility-scale solar']
+
+
+def synthetic_states(count):
+    first = [Region.WASHINGTON, Region.OREGON, Region.CALIFORNIA]
+    rest = [region for region in state_regions() if region not in first]
+    return (first + rest)[:max(count, 3)]
+
+
+def _natural_gas_columns(name, extra_sectors):
+    columns = [f'{name} Natural Gas Total Consumption (MMcf)',
+               f'{name} Natural Gas Lease Fuel Consumption (MMcf)',
+               f'{name} Natural Gas Pipeline & Distribution Use (MMcf)',
+               f'Natural Gas Delivered to Consumers in {name} (MMcf)',
+               f'{name} Natural Gas Residential Consumption (MMcf)',
+               f'{name} Natural Gas Deliveries to Commercial Consumers (Including Vehicle Fuel through 1996) (MMcf)',
+               f'{name} Natural Gas Industrial Consumption (MMcf)',
+               f'{name} Natural Gas Vehicle Fuel Consumption (MMcf)',
+               f'{name} Natural Gas Deliveries to Electric Power Consumers (MMcf)']
+    return columns + [f'{name} Natural Gas Extra Use {index} (MMcf)' for index in range(extra_sectors)]
+
+
+def write_natural_gas_file(path, name, code, years, extra_sectors, rng, scale=1):
+    # years are the Date labels, e.g. 2016 or 'Jan-2016'
+    columns = _natural_gas_columns(name, extra_sectors)
+    with open(path, 'w') as output:
+        output.write(f'Back to Contents,Data 1: {name} Natural Gas Consumption by End Use\n')
+        output.write('Sourcekey,' + ','.join(f'N{3000 + index}{code}2' for index in range(len(columns))) + ',\n')
+        output.write('Date,' + ','.join(f'"{column}"' for column in columns) + ',\n')
+        for year in years:
+            output.write(f'{year},' + ','.join(str(rng.randint(500, 900000) // scale) for _ in columns) + ',\n')
+
+
+def month_labels(months, last_year):
+    # The last `months` months up to December of last_year, oldest first
+    labels = []
+    for index in range(months):
+        offset = last_year * 12 + 11 - index
+        labels.append(f'{calendar.month_abbr[offset % 12 + 1]} {offset // 12}')
+    return labels[::-1]
+
+
+def write_browser_file(path, title, locations, categories, years, rng, frequency_name='Annual'):
+    with open(path, 'w') as output:
+        output.write(f'{title}\n{frequency_name}\n"Source: U.S. Energy Information Administration"\n\n')
+        output.write('"description","units","source key",' + ','.join(f'"{year}"' for year in reversed(years)) + '\n')
+        for location in locations:
+            for category in categories:
+                # Totals stay above the sum of their parts so shares (e.g. renewables) are never negative
+                low, high = (90000 * len(categories), 180000 * len(categories)) if category.startswith('all ') else (10, 90000)
+                values = [f'{rng.uniform(low, high):.3f}' for _ in years]
+                output.write(f'"{location} : {category}","thousand megawatthours","ELEC.SYN",' + ','.join(values) + '\n')
+
+
+def write_synthetic_eia_data(folder, states=3, years=22, sectors=0, seed=0, last_year=2023, months=0):
+    # sectors adds that many extra natural gas columns and retail/generation rows per location
+    rng = random.Random(seed)
+    data_folder = os.path.join(folder, 'USEIA_Data')
+    os.makedirs(data_folder, exist_ok=True)
+    year_range = list(range(last_year - years + 1, last_year + 1))
+    state_list = synthetic_states(states)
+
+    for region in state_list + [Region.UNITED_STATES]:
+        info = region_registry[region]
+        write_natural_gas_file(os.path.join(data_folder, f'NG_CONS_SUM_DCU_{info.natural_gas_code}_A.csv'),
+                               region.value, info.abbreviation, year_range, sectors, rng)
+
+    locations = ['United States', 'Pacific Contiguous'] + [region.value for region in state_list]
+    extra = [f'extra sector {index}' for index in range(sectors)]
+    write_browser_file(os.path.join(data_folder, 'Retail_sales_of_electricity.csv'), 'Retail sales of electricity',
+                       locations, retail_sectors + extra, year_range, rng)
+    write_browser_file(os.path.join(data_folder, 'Net_generation_for_all_sectors.csv'), 'Net generation for all sectors',
+                       locations, generation_sources + extra, year_range, rng)
+
+    if months:
+        labels = month_labels(months, last_year)
+        for region in state_list + [Region.UNITED_STATES]:
+            info = region_registry[region]
+            write_natural_gas_file(os.path.join(data_folder, f'NG_CONS_SUM_DCU_{info.natural_gas_code}_M.csv'),
+                                   region.value, info.abbreviation, [label.replace(' ', '-') for label in labels],
+                                   sectors, rng, 12)
+        write_browser_file(os.path.join(data_folder, 'Retail_sales_of_electricity_monthly.csv'),
+                           'Retail sales of electricity', locations, retail_sectors + extra, labels, rng, 'Monthly')
+    return state_list, year_range
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write synthetic EIA-shaped CSVs')
+    parser.add_argument('folder')
+    parser.add_argument('--states', type=int, default=3)
+    parser.add_argument('--years', type=int, default=22)
+    parser.add_argument('--sectors', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--last-year', type=int, default=2023)
+    parser.add_argument('--months', type=int, default=0, help='also write monthly files with this many months')
+    args = parser.parse_args()
+    write_synthetic_eia_data(args.folder, args.states, args.years, args.sectors, args.seed, args.last_year, args.months)
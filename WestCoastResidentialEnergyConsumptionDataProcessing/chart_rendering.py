@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import textwrap
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from instrumentation import instrumented, stage, count
+
+# Charts are described by plain, picklable job specs so they can be rendered in
+# this process or spread across a process pool. Workers always draw on the
+# non-interactive Agg canvas, and every figure is closed as soon as it is saved.
+#
+# Figures are built with the object-oriented Figure/Axes API on their own Agg
+# canvas, so they never enter pyplot's global figure manager and are freed as
+# soon as render_chart returns. With reuse_figure=True one figure per chart type
+# and size is kept and cleared between charts instead, which keeps memory flat
+# for long batch runs. Only show=True goes through pyplot.
+#
+# render_charts(..., incremental=True) works like make: every output folder keeps
+# a manifest of the digest of each chart's job spec (its data slice plus all of its
+# rendering parameters) and only the charts whose digest changed, or whose file is
+# missing, get rendered again.
+#
+# An AtlasJob lays many chart jobs out as the cells of one shared canvas (e.g. every
+# region x chart type of a year), so a full run is a few large renders and a few
+# files instead of hundreds. The styling shared by all cells (atlas_style) is set once
+# per atlas, and render_atlas_pdf writes a list of atlases as the pages of one PDF
+# (an AtlasBookJob). Both go through render_chart/render_charts like any other job.
+
+# Bump when the drawing code changes so incremental builds redraw everything
+chart_style_version = 2
+chart_manifest_file_name = '.chart_digests.json'
+
+PieChartJob = namedtuple('PieChartJob', ['title', 'file_path', 'values', 'labels', 'colors', 'figsize'])
+
+# series maps a label to its y values, colors maps the same labels to a color
+LineChartJob = namedtuple('LineChartJob', ['title', 'file_path', 'x', 'series', 'colors', 'xticks',
+                                           'xlabel', 'ylabel', 'figsize'])
+
+# rows is a list of rows of chart jobs, None leaves a cell empty; their file_path is unused.
+# cell_size is the (width, height) of one cell in inches, the format follows file_path
+AtlasJob = namedtuple('AtlasJob', ['title', 'file_path', 'rows', 'cell_size'])
+
+# atlases are written as the pages of the PDF at file_path, their own file_path is unused
+AtlasBookJob = namedtuple('AtlasBookJob', ['file_path', 'atlases'])
+
+atlas_style = {'font.size': 9, 'axes.titlesize': 10, 'figure.titlesize': 18}
+atlas_title_width = 45
+
+
+# Function to format pie chart percentages and adjust label positioning
+def autopct_format(pct):
+    return f'{pct:.1f}%' if pct >= 5 else ''
+
+
+def _use_agg_backend():
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+
+def _draw_pie(ax, job, fontsize=14, title_fontsize=16, title=None):
+    wedges, texts, autotexts = ax.pie(job.values, labels=job.labels, colors=job.colors,
+                                      autopct=autopct_format, startangle=140,
+                                      textprops={'fontsize': fontsize}, pctdistance=0.85)
+
+    # Adjust the position of labels to ensure they don't overlap
+    for text, autotext in zip(texts, autotexts):
+        if autotext.get_text() == '':
+            text.set_visible(False)
+
+    ax.set_title(job.title if title is None else title, fontsize=title_fontsize, pad=18)
+
+
+def _draw_pie_chart(fig, job):
+    ax = fig.add_subplot()
+    _draw_pie(ax, job)
+    fig.tight_layout()
+    ax.axis('equal')  # Equal aspect ratio ensures that the pie chart is circular.
+
+
+def _draw_line(ax, job, title=None):
+    for label, values in job.series.items():
+        ax.plot(job.x, values, marker='o', color=job.colors[label], label=label)
+    ax.set_title(job.title if title is None else title)
+    ax.set_xlabel(job.xlabel)
+    ax.set_xticks(job.xticks)
+    ax.set_ylabel(job.ylabel)
+    ax.grid(True)
+    if len(job.series) > 1:
+        ax.legend()
+
+
+def _draw_line_chart(fig, job):
+    _draw_line(fig.add_subplot(), job)
+
+
+def _atlas_shape(atlas):
+    return len(atlas.rows), max((len(row) for row in atlas.rows), default=0)
+
+
+def _draw_atlas(fig, atlas):
+    # Cells take their fonts from atlas_style (active around this call), one layout pass for the whole canvas
+    import matplotlib
+
+    row_count, column_count = _atlas_shape(atlas)
+    axes = fig.subplots(row_count, column_count, squeeze=False)
+    for cell_row, job_row in zip(axes, atlas.rows):
+        for position, ax in enumerate(cell_row):
+            job = job_row[position] if position < len(job_row) else None
+            if job is None:
+                ax.axis('off')
+                continue
+            title = textwrap.fill(job.title, atlas_title_width)
+            if isinstance(job, PieChartJob):
+                _draw_pie(ax, job, matplotlib.rcParams['font.size'], matplotlib.rcParams['axes.titlesize'], title)
+                ax.axis('equal')
+            else:
+                _draw_line(ax, job, title)
+    fig.suptitle(atlas.title)
+
+
+def _atlas_figure(atlas):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    row_count, column_count = _atlas_shape(atlas)
+    width, height = atlas.cell_size
+    fig = Figure(figsize=(column_count * width, row_count * height), layout='constrained')
+    FigureCanvasAgg(fig)
+    return fig
+
+
+@instrumented('render_atlas')
+def render_atlas(atlas):
+    import matplotlib
+
+    with matplotlib.rc_context(atlas_style):
+        fig = _atlas_figure(atlas)
+        try:
+            with stage('draw'):
+                _draw_atlas(fig, atlas)
+            with stage('savefig'):
+                fig.savefig(atlas.file_path, transparent=True)
+                count(figures=1)
+        finally:
+            fig.clear()
+    return atlas.file_path
+
+
+@instrumented('render_atlas_pdf')
+def render_atlas_pdf(atlases, file_path):
+    # One page per atlas, in order, in a single PDF; the atlases' own file_path is unused
+    import matplotlib
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with matplotlib.rc_context(atlas_style), PdfPages(file_path) as pdf:
+        for atlas in atlases:
+            fig = _atlas_figure(atlas)
+            try:
+                with stage('draw'):
+                    _draw_atlas(fig, atlas)
+                with stage('savefig'):
+                    pdf.savefig(fig)
+                    count(figures=1)
+            finally:
+                fig.clear()
+    return file_path
+
+
+_reusable_figures = {}
+
+
+def _new_figure(figsize):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _figure_for(job, reuse_figure):
+    if not reuse_figure:
+        return _new_figure(job.figsize)
+
+    key = (type(job).__name__, tuple(job.figsize))
+    fig = _reusable_figures.get(key)
+    if fig is None:
+        fig = _reusable_figures[key] = _new_figure(job.figsize)
+    else:
+        import matplotlib
+
+        # tight_layout leaves its subplot params behind, start every chart from the defaults
+        fig.clear()
+        fig.subplots_adjust(**{name: matplotlib.rcParams[f'figure.subplot.{name}']
+                               for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')})
+    return fig
+
+
+def release_reused_figures():
+    for fig in _reusable_figures.values():
+        fig.clear()
+    _reusable_figures.clear()
+
+
+def _draw(fig, job):
+    if isinstance(job, PieChartJob):
+        _draw_pie_chart(fig, job)
+    else:
+        _draw_line_chart(fig, job)
+
+
+@instrumented('render_chart')
+def render_chart(job, show=False, reuse_figure=False):
+    if isinstance(job, AtlasJob):
+        return render_atlas(job)
+    if isinstance(job, AtlasBookJob):
+        return render_atlas_pdf(job.atlases, job.file_path)
+    if show:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=job.figsize)
+        try:
+            _draw(fig, job)
+            fig.savefig(job.file_path, transparent=True)
+            count(figures=1)
+
+            # Display the chart
+            plt.show()
+        finally:
+            plt.close(fig)
+        return job.file_path
+
+    fig = _figure_for(job, reuse_figure)
+    try:
+        with stage('draw'):
+            _draw(fig, job)
+        with stage('savefig'):
+            fig.savefig(job.file_path, transparent=True)
+            count(figures=1)
+    finally:
+        if not reuse_figure:
+            fig.clear()
+    return job.file_path
+
+
+def chart_job_digest(job):
+    spec = {'type': type(job).__name__, 'style': chart_style_version, 'job': job._asdict()}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def chart_output_path(job):
+    # savefig appends the default format when the path has none
+    return job.file_path if os.path.splitext(job.file_path)[1] else job.file_path + '.png'
+
+
+def _read_chart_manifest(folder):
+    try:
+        with open(os.path.join(folder, chart_manifest_file_name)) as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_chart_manifest(folder, digests):
+    manifest_path = os.path.join(folder, chart_manifest_file_name)
+    with open(manifest_path + '.tmp', 'w') as manifest:
+        json.dump(digests, manifest, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def out_of_date_chart_jobs(jobs):
+    # Jobs whose output is missing or was rendered from different inputs
+    manifests = {}
+    out_of_date = []
+    for job in jobs:
+        folder = os.path.dirname(os.path.abspath(job.file_path))
+        if folder not in manifests:
+            manifests[folder] = _read_chart_manifest(folder)
+        recorded = manifests[folder].get(os.path.basename(job.file_path))
+        if recorded != chart_job_digest(job) or not os.path.exists(chart_output_path(job)):
+            out_of_date.append(job)
+    return out_of_date
+
+
+def record_rendered_chart_jobs(jobs):
+    jobs_by_folder = {}
+    for job in jobs:
+        jobs_by_folder.setdefault(os.path.dirname(os.path.abspath(job.file_path)), []).append(job)
+    for folder, folder_jobs in jobs_by_folder.items():
+        digests = _read_chart_manifest(folder)
+        digests.update({os.path.basename(job.file_path): chart_job_digest(job) for job in folder_jobs})
+        _write_chart_manifest(folder, digests)
+
+
+@instrumented('render_charts')
+def render_charts(jobs, max_workers=None, reuse_figures=True, incremental=False):
+    # Renders the jobs and returns the written paths in the same order as the jobs,
+    # with incremental=True jobs that are already up to date are skipped
+    jobs = list(jobs)
+    if incremental:
+        jobs = out_of_date_chart_jobs(jobs)
+    if not jobs:
+        return []
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(jobs))
+    render = partial(render_chart, reuse_figure=reuse_figures)
+    if max_workers <= 1:
+        rendered = [render(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_use_agg_backend) as pool:
+            rendered = list(pool.map(render, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+        # The workers' own savefig counts stay in their processes, so the figures are counted here
+        count(figures=len(rendered))
+
+    # Always keep the manifest current so a later incremental run can rely on it
+    record_rendered_chart_jobs(jobs)
+    return rendered
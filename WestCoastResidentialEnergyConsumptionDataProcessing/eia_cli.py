@@ -0,0 +1,324 @@
+import argparse
+import os
+import sys
+
+from regions import parse_years
+
+# Command line entry point. Only the standard library and regions.py are imported
+# up front, so --help, `regions` and `years` (answered from the on-disk cache
+# manifest) start in milliseconds. pandas and the pipeline are imported when a
+# command needs data, and matplotlib only when charts are actually rendered.
+#
+#   python eia_cli.py charts --charts natural-gas,combined --regions WA,OR,CA --years 2020-2023
+#   python eia_cli.py charts --charts over-time --over-time 2002-2023 --show-all
+#   python eia_cli.py charts --charts over-time-monthly --over-time 2016-2024
+#   python eia_cli.py charts --charts generation-over-time --regions WA,OR --show-all
+#   python eia_cli.py atlas --by year --years 2016-2023 --format pdf
+#   python eia_cli.py regions --available
+#   python eia_cli.py years
+#   python eia_cli.py query --regions WEST_COAST --years 2016-2023 --sectors Residential --split
+#   python eia_cli.py query --regions WA --sectors Residential --emissions
+#   python eia_cli.py serve --port 8765
+#   python eia_cli.py --ingest-workers 8 ingest
+#   python eia_cli.py export --database eia.sqlite
+
+script_folder = os.path.dirname(os.path.abspath(__file__))
+default_data_folder = os.path.join(script_folder, 'USEIA_Data')
+default_output_folder = os.path.dirname(script_folder)
+
+# Same as chart_types in the pipeline module, repeated here so --help needs no pandas
+chart_type_names = ['natural-gas', 'electricity', 'combined', 'combined-split', 'generation', 'over-time',
+                    'over-time-monthly', 'generation-over-time']
+pie_chart_type_names = ['natural-gas', 'electricity', 'combined', 'combined-split', 'generation']
+default_region_names = 'WASHINGTON,OREGON,CALIFORNIA,WEST_COAST,UNITED_STATES'
+
+
+def parse_year_range(text):
+    years = parse_years(text)
+    return years[0], years[-1]
+
+
+def parse_regions(text):
+    from regions import find_region
+    return [find_region(name) for name in text.split(',') if name.strip()]
+
+
+def parse_chart_types(text):
+    charts = [name.strip() for name in text.split(',') if name.strip()]
+    if 'all' in charts:
+        # Every annual chart, the monthly one needs the _M files and has to be asked for
+        return [name for name in chart_type_names if name != 'over-time-monthly'] + \
+               [name for name in charts if name == 'over-time-monthly']
+    unknown = [name for name in charts if name not in chart_type_names]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown chart type(s): {", ".join(unknown)}')
+    return charts
+
+
+def parse_pie_chart_types(text):
+    charts = [name.strip() for name in text.split(',') if name.strip()]
+    if 'all' in charts:
+        return list(pie_chart_type_names)
+    unknown = [name for name in charts if name not in pie_chart_type_names]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'not a pie chart type: {", ".join(unknown)}')
+    return charts
+
+
+def _configure_ingestion(args):
+    import eia_data_loader
+
+    eia_data_loader.ingestion_workers = args.ingest_workers
+    eia_data_loader.ingestion_processes = args.ingest_processes
+    return eia_data_loader
+
+
+def _selection_error(args, error):
+    # Years or regions the data folder has nothing for, reported like a bad flag
+    args.parser.error(f'{error}; see the `years` and `regions --available` commands')
+
+
+def _check_regions(args, pipeline, regions, kinds):
+    missing = pipeline.regions_without_data(regions, kinds)
+    if missing:
+        _selection_error(args, f'No data for {", ".join(region.name for region in missing)}')
+
+
+def _load_pipeline(args):
+    _configure_ingestion(args)
+    import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+
+    pipeline.set_data_folder(args.data_dir)
+    return pipeline
+
+
+def command_charts(args):
+    if args.trace:
+        import instrumentation
+        instrumentation.enable()
+
+    pipeline = _load_pipeline(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        jobs = pipeline.build_chart_jobs(args.charts, args.regions, args.years, args.output_dir, args.over_time,
+                                         args.show_all)
+    except ValueError as error:
+        _selection_error(args, error)
+
+    from chart_rendering import render_chart, render_charts
+    if args.show:
+        for job in jobs:
+            render_chart(job, show=True)
+        rendered = jobs
+    else:
+        rendered = render_charts(jobs, args.workers, incremental=not args.full)
+    print(f'Rendered {len(rendered)} of {len(jobs)} charts')
+
+    if args.trace:
+        instrumentation.write_trace(args.trace)
+    return 0
+
+
+def command_atlas(args):
+    if args.trace:
+        import instrumentation
+        instrumentation.enable()
+
+    pipeline = _load_pipeline(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        rendered = pipeline.make_chart_atlas(args.charts, args.regions, args.years, args.output_dir, args.by,
+                                             args.format, args.workers, incremental=not args.full)
+    except ValueError as error:
+        _selection_error(args, error)
+    for path in rendered:
+        print(path)
+
+    if args.trace:
+        instrumentation.write_trace(args.trace)
+    return 0
+
+
+def command_regions(args):
+    from regions import region_registry, has_natural_gas_data
+
+    for region, info in region_registry.items():
+        present = has_natural_gas_data(region, args.data_dir)
+        if args.available and not present:
+            continue
+        kind = 'composite' if info.members else 'state'
+        print(f'{region.name:<24} {info.abbreviation or "":<3} {kind:<9} {"data" if present else "-":<5} {info.print_name}')
+    return 0
+
+
+def command_years(args):
+    import eia_disk_cache
+    from eia_sources import discover_sources
+
+    for kind, path in discover_sources(args.data_dir):
+        years = eia_disk_cache.cached_years(kind, path)
+        if years is None:
+            if args.cache_only:
+                print(f'{os.path.basename(path)}: not cached')
+                continue
+            # Stale or missing cache entry: load it once, which also refreshes the cache
+            import eia_data_loader
+            table = eia_data_loader.source_loaders[kind](path)
+            years = sorted({eia_data_loader.period_year(date) for date in table['Date'].drop_duplicates()})
+        print(f'{os.path.basename(path)}: {years[0]}-{years[-1]}' if years else f'{os.path.basename(path)}: none')
+    return 0
+
+
+def command_ingest(args):
+    import time
+    eia_data_loader = _configure_ingestion(args)
+
+    # Parses every source file in the data folder into the disk cache, so later runs start warm
+    started = time.perf_counter()
+    tables = eia_data_loader.ingest_sources(eia_data_loader.discover_sources(args.data_dir))
+    for (kind, path), table in tables.items():
+        print(f'{os.path.basename(path)}: {len(table)} rows ({kind})')
+    print(f'Ingested {len(tables)} files in {time.perf_counter() - started:.2f} s')
+    return 0
+
+
+def command_query(args):
+    pipeline = _load_pipeline(args)
+    from energy_dataset import EnergyDataset
+
+    kinds = ['natural_gas_monthly', 'electricity_sales_monthly'] if args.monthly else ['natural_gas', 'electricity_sales']
+    _check_regions(args, pipeline, args.regions, kinds + (['electricity_generation'] if args.emissions else []))
+
+    # Only the sectors, years and regions asked for are read from the files
+    dataset = EnergyDataset(frequency='M' if args.monthly else 'A').region(args.regions).years(args.years) \
+        .allocated(not args.split, args.emissions)
+    if args.sectors:
+        dataset = dataset.sectors([sector.strip() for sector in args.sectors.split(',')])
+    try:
+        data = dataset.collect().to_frame()
+    except KeyError as error:
+        _selection_error(args, error.args[0])
+    if data.empty:
+        print(f'No rows for {", ".join(region.name for region in args.regions)} in {args.years[0]}-{args.years[-1]}',
+              file=sys.stderr)
+    data.index = data.index.set_levels([region.name for region in data.index.levels[0]], level=0)
+    data.to_csv(sys.stdout)
+    return 0
+
+
+def command_export(args):
+    pipeline = _load_pipeline(args)
+    import sqlite_export
+
+    if args.regions is not None:
+        _check_regions(args, pipeline, args.regions, ['natural_gas', 'electricity_sales', 'electricity_generation'])
+
+    changes = sqlite_export.export_to_sqlite(args.database, args.regions, args.full)
+    for table, rows in changes.items():
+        print(f'{table}: {rows} rows written')
+    return 0
+
+
+def command_serve(args):
+    import asyncio
+    _load_pipeline(args)
+    import eia_service
+
+    try:
+        asyncio.run(eia_service.serve(args.host, args.port, args.cache_size, args.poll))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='eia_cli.py',
+                                     description='Natural gas and electricity use by sector from US EIA data')
+    parser.add_argument('--data-dir', default=default_data_folder, help='folder with the EIA CSVs (default: %(default)s)')
+    parser.add_argument('--ingest-workers', type=int,
+                        help='source files parsed at once on a cold start (default: one per core, 1: one at a time)')
+    parser.add_argument('--ingest-processes', action='store_true',
+                        help='parse the source files in processes instead of threads')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    charts = commands.add_parser('charts', help='render charts')
+    charts.add_argument('--charts', type=parse_chart_types, default=['over-time'],
+                        help=f'comma separated, any of {", ".join(chart_type_names)} or all (every annual chart, '
+                             'default: over-time)')
+    charts.add_argument('--regions', type=parse_regions, default=default_region_names,
+                        help='comma separated names, values or state abbreviations (default: the West Coast states, '
+                             'the West Coast and the US)')
+    charts.add_argument('--years', type=parse_years, default='2016', help='pie chart years, e.g. 2016,2020-2023')
+    charts.add_argument('--over-time', type=parse_year_range, default='2002-2023',
+                        help='year range of the over time charts (default: %(default)s)')
+    charts.add_argument('--show-all', action='store_true',
+                        help='plot every sector (or fossil fuel) in the over time charts')
+    charts.add_argument('--output-dir', default=default_output_folder,
+                        help='year folders and over time charts go here (default: %(default)s)')
+    charts.add_argument('--workers', type=int, help='render processes (default: one per core)')
+    charts.add_argument('--full', action='store_true', help='re-render every chart, not only the out of date ones')
+    charts.add_argument('--show', action='store_true', help='display each chart as it is rendered')
+    charts.add_argument('--trace', help='write stage timings to this Chrome trace file')
+    charts.set_defaults(handler=command_charts, parser=charts)
+
+    atlas = commands.add_parser('atlas', help='render the pie charts as one composite figure per year or region')
+    atlas.add_argument('--by', choices=['year', 'region'], default='year',
+                       help='one figure per year (a row per region) or per region (a row per year)')
+    atlas.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png',
+                       help='pdf writes every figure as a page of one file (default: %(default)s)')
+    atlas.add_argument('--charts', type=parse_pie_chart_types, default='natural-gas,electricity,combined,generation',
+                       help=f'columns, comma separated from {", ".join(pie_chart_type_names)} or all')
+    atlas.add_argument('--regions', type=parse_regions, default=default_region_names,
+                       help='comma separated region names or abbreviations')
+    atlas.add_argument('--years', type=parse_years, default='2016', help='e.g. 2016,2020-2023')
+    atlas.add_argument('--output-dir', default=default_output_folder, help='(default: %(default)s)')
+    atlas.add_argument('--workers', type=int, help='render processes for png/svg (default: one per core)')
+    atlas.add_argument('--full', action='store_true', help='re-render every figure, not only the out of date ones')
+    atlas.add_argument('--trace', help='write stage timings to this Chrome trace file')
+    atlas.set_defaults(handler=command_atlas, parser=atlas)
+
+    regions = commands.add_parser('regions', help='list known regions')
+    regions.add_argument('--available', action='store_true', help='only regions with natural gas data on hand')
+    regions.set_defaults(handler=command_regions)
+
+    years = commands.add_parser('years', help='list the years in each source file')
+    years.add_argument('--cache-only', action='store_true', help='never parse a CSV, only read the cache manifest')
+    years.set_defaults(handler=command_years)
+
+    ingest = commands.add_parser('ingest', help='parse every source file into the disk cache')
+    ingest.set_defaults(handler=command_ingest)
+
+    query = commands.add_parser('query', help='print allocated natural gas use by sector as CSV')
+    query.add_argument('--regions', type=parse_regions, default=default_region_names)
+    query.add_argument('--years', type=parse_years, default='2002-2023')
+    query.add_argument('--sectors', help='comma separated columns to keep')
+    query.add_argument('--split', action='store_true', help="keep '<Sector> Electricity' separate instead of combined")
+    query.add_argument('--monthly', action='store_true', help='one row per month, from the _M and monthly files')
+    query.add_argument('--emissions', action='store_true',
+                       help="add '<Sector> Electricity CO2' (thousand metric tons) at each year's generation mix")
+    query.set_defaults(handler=command_query, parser=query)
+
+    export = commands.add_parser('export', help='write the normalized and allocated tables to SQLite')
+    export.add_argument('--database', default='eia.sqlite', help='SQLite file, created if missing (default: %(default)s)')
+    export.add_argument('--regions', type=parse_regions,
+                        help='default: every region with natural gas and retail sales data')
+    export.add_argument('--full', action='store_true',
+                        help='rewrite every year, not only new ones and the most recent (revised) ones')
+    export.set_defaults(handler=command_export, parser=export)
+
+    serve = commands.add_parser('serve', help='answer JSON queries over HTTP, see eia_service.py')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--cache-size', type=int, default=1024, help='query results kept (default: %(default)s)')
+    serve.add_argument('--poll', type=float, default=5.0, help='seconds between checks for changed source files')
+    serve.set_defaults(handler=command_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,448 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+import numpy as np
+import pandas as pd
+import eia_disk_cache
+from eia_sources import browser_source_kinds, source_kind, discover_sources
+from instrumentation import instrumented, stage, count
+
+# Every source file in USEIA_Data/ is parsed once into a tidy long-format table
+# (one row per region/year/sector) and kept here for the rest of the run.
+# The parse_* functions in the main script are just views over these tables.
+# Set use_disk_cache to False to always parse the CSVs instead of going through
+# the on-disk cache in eia_disk_cache.
+#
+# Annual tables have the year as an int in 'Date'. Monthly ones (the _M natural gas
+# files and freq=M browser exports) have the first day of the month as a Timestamp.
+# When a monthly file changes, only the periods after the ones already cached, plus
+# the last revision_periods of them (EIA revises recent months), are read and
+# appended to the stored table; set append_monthly_updates to False to always
+# rebuild it from the whole file.
+
+# Dynamic renaming based on keywords to filter out location names, and get eveyrthign on the same naming scheme
+natural_gas_sector_keywords = {
+    'Residential': 'Residential',
+    'Commercial': 'Commercial',
+    'Industrial': 'Industrial',
+    'Vehicle Fuel Consumption': 'Vehicle Fuel',
+    'Electric Power': 'Electric Power',
+    'Delivered to Consumers': 'Total Delivered'
+}
+
+# Map sector descriptions to standardized sector names
+electricity_sector_names = {
+    'all sectors': 'Total Delivered',
+    'residential': 'Residential',
+    'commercial': 'Commercial',
+    'industrial': 'Industrial',
+    'transportation': 'Vehicle Fuel',
+    'other': 'Other'
+}
+
+# Map source descriptions to standardized source names
+generation_source_names = {
+    'all fuels': 'Total Generated',
+    'coal': 'Coal',
+    'petroleum liquids': 'Petroluem',
+    'petroleum coke': 'Petroleum Coke',
+    'natural gas': 'Natural Gas',
+    'other': 'Other gases'
+}
+
+use_disk_cache = True
+append_monthly_updates = True
+revision_periods = 3
+
+# Browser exports bigger than this (e.g. national bulk files) are read in chunks
+streaming_threshold_bytes = 64 * 2**20
+streaming_chunk_rows = 20000
+
+# Files parsed at once by ingest_sources(): None for one per core, 1 to read them one
+# after another. Processes sidestep the GIL for the pure-Python parts of normalizing
+ingestion_workers = None
+ingestion_processes = False
+
+_table_cache = {}
+_index_cache = {}
+
+
+def clear_table_cache():
+    _table_cache.clear()
+    _index_cache.clear()
+
+
+def _cached_table(kind, path, normalize, normalize_since=None):
+    # normalize_since(path, since) parses only the periods from since on, see _append_new_periods
+    key = (kind, os.path.abspath(path))
+    if key not in _table_cache:
+        if use_disk_cache:
+            update = None
+            if normalize_since is not None and append_monthly_updates:
+                update = _append_new_periods(normalize_since)
+            _table_cache[key] = eia_disk_cache.load_or_build(kind, path, normalize, update)
+        else:
+            _table_cache[key] = normalize(path)
+    return _table_cache[key]
+
+
+def _append_new_periods(normalize_since):
+    def update(stored_table, path):
+        periods = stored_table['Date'].drop_duplicates().sort_values()
+        if periods.empty:
+            return None
+        since = periods.iloc[-revision_periods:].iloc[0]
+        new_rows = normalize_since(path, since=since)
+        if new_rows.empty or list(new_rows.columns) != list(stored_table.columns):
+            # Nothing recognisable from since on, or the layout changed: rebuild from scratch
+            return None
+        return pd.concat([stored_table[stored_table['Date'] < since], new_rows], ignore_index=True)
+    return update
+
+
+period_label_formats = ['%b %Y', '%b-%Y', '%Y-%m', '%Y%m', '%Y-%m-%d', '%m/%d/%Y', '%b %d, %Y']
+
+
+def parse_period_label(label):
+    # "2016" -> 2016, monthly labels ("Jan 2016", "Jan-2016", "2016-01", ...) -> Timestamp('2016-01-01'),
+    # anything else -> None
+    label = str(label).strip()
+    if label.isdigit() and len(label) == 4:
+        return int(label)
+    for label_format in period_label_formats:
+        try:
+            parsed = datetime.strptime(label, label_format)
+        except ValueError:
+            continue
+        return pd.Timestamp(parsed.year, parsed.month, 1)
+    return None
+
+
+def period_dates(labels):
+    if pd.api.types.is_numeric_dtype(labels):
+        return labels.astype(int)
+    periods = {label: parse_period_label(label) for label in labels.unique()}
+    dates = labels.map(periods)
+    if pd.api.types.is_numeric_dtype(dates):
+        return dates.astype(int)
+    return pd.to_datetime(dates)
+
+
+def period_year(period):
+    return period if isinstance(period, (int, np.integer)) else period.year
+
+
+@instrumented('normalize_natural_gas_csv', 'path')
+def normalize_natural_gas_csv(path, since=None, sectors=None):
+    # sectors limits the parse to those standardized sector columns
+    sector_keywords = natural_gas_sector_keywords
+    if sectors is not None:
+        sector_keywords = {keyword: name for keyword, name in natural_gas_sector_keywords.items() if name in sectors}
+    with stage('read_csv', path):
+        data = pd.read_csv(path, skiprows=2, usecols=None if sectors is None else
+                           lambda column: column == 'Date' or any(keyword in column for keyword in sector_keywords))
+        count(rows=len(data), bytes_read=os.path.getsize(path))
+
+    # Cleanup
+    data = data.dropna(subset=['Date'])
+    data['Date'] = period_dates(data['Date'])
+    if since is not None:
+        data = data[data['Date'] >= since]
+    data = data.fillna(0)
+
+    # Drop the unwanted 'Unnamed: 10' column if it exists
+    if 'Unnamed: 10' in data.columns:
+        data = data.drop(columns=['Unnamed: 10'])
+
+    rename_columns = {}
+    for col in data.columns:
+        for keyword, new_name in sector_keywords.items():
+            if keyword in col:
+                rename_columns[col] = new_name
+    data = data.rename(columns=rename_columns)
+
+    # Select the relevant columns based on the expected consumption categories
+    columns_of_interest = ['Date'] + list(sector_keywords.values())
+    data = data[columns_of_interest]
+
+    # Long format: Date, Sector, Value
+    long_data = data.melt(id_vars='Date', var_name='Sector', value_name='Value')
+    long_data['Value'] = long_data['Value'].astype(float)
+    return long_data
+
+
+def _normalize_browser_rows(data, period_columns, rename_map, category_column):
+    # Everything after the ': ' is the sector/source, everything before it the region
+    category = data['description'].str.extract(r': (.*)')[0].fillna(data['description'])
+    ids = pd.DataFrame({
+        'description': data['description'],
+        'Region': data['description'].str.split(':').str[0].str.strip(),
+        category_column: category.str.lower().str.strip().map(rename_map).fillna(category.str.strip())})
+
+    # Joined in one go, inserting into a wide frame of one block per string column fragments it
+    long_data = pd.concat([ids, data[period_columns]], axis=1).melt(
+        id_vars=['description', 'Region', category_column], value_vars=period_columns, var_name='Date', value_name='Value')
+    long_data['Date'] = period_dates(long_data['Date'])
+
+    # Convert "--" to NaN to handle it easily later and fill with 0
+    long_data['Value'] = pd.to_numeric(long_data['Value'], errors='coerce').fillna(0)
+    return long_data
+
+
+@instrumented('normalize_eia_browser_csv', 'path')
+def normalize_eia_browser_csv(path, rename_map, category_column='Sector', since=None):
+    # Big bulk exports are streamed, the small hand-exported extracts are read in one go.
+    # Appends are streamed too, so only the new period columns get parsed
+    if since is not None or os.path.getsize(path) > streaming_threshold_bytes:
+        return stream_eia_browser_csv(path, rename_map, category_column, since=since)
+
+    # Load data exported from the EIA electricity data browser
+    with stage('read_csv', path):
+        data = pd.read_csv(path, skiprows=4)
+        count(rows=len(data), bytes_read=os.path.getsize(path))
+    period_columns = [col for col in data.columns if parse_period_label(col) is not None]
+    data = data[['description'] + period_columns]
+    return _normalize_browser_rows(data, period_columns, rename_map, category_column)
+
+
+def find_browser_header_row(path, max_lines=50):
+    # Browser exports start with a few lines of title/source text before the header
+    with open(path, newline='') as source:
+        for line_number, line in enumerate(source):
+            if line_number >= max_lines:
+                break
+            if line.split(',')[0].strip().strip('"').lower() == 'description':
+                return line_number
+    return 4
+
+
+@instrumented('stream_eia_browser_csv', 'path')
+def stream_eia_browser_csv(path, rename_map, category_column='Sector', locations=None, years=None,
+                           chunksize=None, since=None):
+    # Reads an EIA browser export (e.g. every state, every year) chunk by chunk. Only the
+    # description and the requested year (or month) columns are parsed, rows outside of
+    # locations are dropped as soon as each chunk is read, so memory follows the selection
+    # and not the file.
+    header_row = find_browser_header_row(path)
+    header = pd.read_csv(path, skiprows=header_row, nrows=0).columns
+    periods = {col: parse_period_label(col) for col in header}
+    year_columns = [col for col in header if periods[col] is not None]
+    if years is not None:
+        wanted_years = set(years)
+        year_columns = [col for col in year_columns if period_year(periods[col]) in wanted_years]
+    if since is not None:
+        year_columns = [col for col in year_columns if periods[col] >= since]
+    if locations is not None:
+        locations = set(locations)
+
+    reader = pd.read_csv(path, skiprows=header_row, usecols=['description'] + year_columns,
+                         dtype=str, chunksize=chunksize or streaming_chunk_rows)
+    long_chunks = []
+    count(bytes_read=os.path.getsize(path))
+    for chunk in reader:
+        chunk = chunk.dropna(subset=['description'])
+        if locations is not None:
+            chunk = chunk[chunk['description'].str.split(':').str[0].str.strip().isin(locations)]
+        if len(chunk):
+            long_chunks.append(_normalize_browser_rows(chunk, year_columns, rename_map, category_column))
+
+    if not long_chunks:
+        return _normalize_browser_rows(pd.DataFrame(columns=['description'] + year_columns), year_columns,
+                                       rename_map, category_column)
+    return pd.concat(long_chunks, ignore_index=True)
+
+
+def load_natural_gas_table(path):
+    return _cached_table('natural_gas', path, normalize_natural_gas_csv)
+
+
+def load_electricity_sales_table(path):
+    return _cached_table('electricity_sales', path,
+                         lambda p: normalize_eia_browser_csv(p, electricity_sector_names, 'Sector'))
+
+
+def load_electricity_generation_table(path):
+    return _cached_table('electricity_generation', path,
+                         lambda p: normalize_eia_browser_csv(p, generation_source_names, 'Source'))
+
+
+def load_natural_gas_monthly_table(path):
+    return _cached_table('natural_gas_monthly', path, normalize_natural_gas_csv, normalize_natural_gas_csv)
+
+
+def load_electricity_sales_monthly_table(path):
+    normalize = source_normalizers['electricity_sales_monthly']
+    return _cached_table('electricity_sales_monthly', path, normalize, normalize)
+
+
+def load_electricity_generation_monthly_table(path):
+    normalize = source_normalizers['electricity_generation_monthly']
+    return _cached_table('electricity_generation_monthly', path, normalize, normalize)
+
+
+# kind -> normalize(path) of each source file, module level so a process pool can pickle them.
+# Those of appendable_kinds also take since= (see _append_new_periods)
+source_normalizers = {
+    'natural_gas': normalize_natural_gas_csv,
+    'natural_gas_monthly': normalize_natural_gas_csv,
+    'electricity_sales': partial(normalize_eia_browser_csv, rename_map=electricity_sector_names, category_column='Sector'),
+    'electricity_generation': partial(normalize_eia_browser_csv, rename_map=generation_source_names,
+                                      category_column='Source'),
+    'electricity_sales_monthly': partial(normalize_eia_browser_csv, rename_map=electricity_sector_names,
+                                         category_column='Sector'),
+    'electricity_generation_monthly': partial(normalize_eia_browser_csv, rename_map=generation_source_names,
+                                              category_column='Source'),
+}
+
+appendable_kinds = {'natural_gas_monthly', 'electricity_sales_monthly', 'electricity_generation_monthly'}
+
+source_loaders = {
+    'natural_gas': load_natural_gas_table,
+    'natural_gas_monthly': load_natural_gas_monthly_table,
+    'electricity_sales': load_electricity_sales_table,
+    'electricity_generation': load_electricity_generation_table,
+    'electricity_sales_monthly': load_electricity_sales_monthly_table,
+    'electricity_generation_monthly': load_electricity_generation_monthly_table,
+}
+
+
+def _normalize_source(kind, path):
+    # Runs on the ingestion pool. A changed monthly source with an older version in the disk
+    # cache only has its new periods parsed and appended, as _cached_table would do
+    if use_disk_cache and append_monthly_updates and kind in appendable_kinds:
+        stored = eia_disk_cache.stored_table(kind, path)
+        if stored is not None:
+            with stage('append_update', path):
+                table = _append_new_periods(source_normalizers[kind])(stored, path)
+            if table is not None:
+                return table
+    return source_normalizers[kind](path)
+
+
+@instrumented('ingest_sources')
+def ingest_sources(sources, workers=None, processes=None):
+    # Loads every (kind, path) into the table cache, parsing the files that have no up to
+    # date disk cache entry concurrently so a cold start takes about as long as the slowest
+    # file. Workers only parse (changed monthly sources only their new periods, see
+    # _normalize_source); cache files and the manifest are written here afterwards,
+    # one source at a time in the order given, so the result does not depend on which
+    # file finished first. Returns {(kind, path): table} in that order.
+    workers = ingestion_workers if workers is None else workers
+    processes = ingestion_processes if processes is None else processes
+    sources = list(dict.fromkeys(sources))
+    pending = [(kind, path) for kind, path in sources if (kind, os.path.abspath(path)) not in _table_cache]
+    to_parse = [(kind, path) for kind, path in pending
+                if not (use_disk_cache and eia_disk_cache.is_fresh(kind, path))]
+
+    parsed = {}
+    if len(to_parse) > 1 and workers != 1:
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with stage('parse_concurrently'), executor(max_workers=min(workers or os.cpu_count(), len(to_parse))) as pool:
+            kinds, paths = zip(*to_parse)
+            parsed = dict(zip(to_parse, pool.map(_normalize_source, kinds, paths)))
+
+    for kind, path in pending:
+        table = parsed.get((kind, path))
+        if table is None:
+            # Fresh on disk, or the only file to parse (appending on its own if it can)
+            source_loaders[kind](path)
+        else:
+            _cached_table(kind, path, lambda _, table=table: table)
+    return {(kind, path): _table_cache[(kind, os.path.abspath(path))] for kind, path in sources}
+
+
+def _in_years(dates, years):
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = dates.dt.year
+    return dates.isin(list(years))
+
+
+def _loaded_table(kind, path, filters):
+    # The selected rows of a whole table that is already on hand, in memory or in an
+    # up-to-date disk cache entry; None when getting them would mean parsing the CSV
+    table = _table_cache.get((kind, os.path.abspath(path)))
+    if table is None:
+        return eia_disk_cache.load_if_fresh(kind, path, filters) if use_disk_cache else None
+    for column, values in filters.items():
+        if values is not None:
+            table = table[_in_years(table[column], values) if column == 'Date' else table[column].isin(list(values))]
+    return table
+
+
+@instrumented('scan_natural_gas_table', 'path')
+def scan_natural_gas_table(path, sectors=None, years=None, monthly=False):
+    # Just the rows of the given sectors and years. An already loaded table is filtered,
+    # otherwise only those sector columns are parsed. Not cached: the result depends on
+    # the selection
+    table = _loaded_table('natural_gas_monthly' if monthly else 'natural_gas', path,
+                          {'Sector': sectors, 'Date': years})
+    if table is None:
+        table = normalize_natural_gas_csv(path, sectors=sectors)
+        if years is not None:
+            table = table[_in_years(table['Date'], years)]
+    return table
+
+
+def _scan_browser_table(kind, path, rename_map, category_column, locations, years):
+    table = _loaded_table(kind, path, {'Region': locations, 'Date': years})
+    if table is None:
+        # Only the description, the year columns asked for and the rows of the locations get parsed
+        table = stream_eia_browser_csv(path, rename_map, category_column, locations, years)
+    return table
+
+
+@instrumented('scan_electricity_sales_table', 'path')
+def scan_electricity_sales_table(path, locations=None, years=None, monthly=False):
+    return _scan_browser_table('electricity_sales_monthly' if monthly else 'electricity_sales', path,
+                               electricity_sector_names, 'Sector', locations, years)
+
+
+@instrumented('scan_electricity_generation_table', 'path')
+def scan_electricity_generation_table(path, locations=None, years=None):
+    return _scan_browser_table('electricity_generation', path, generation_source_names, 'Source', locations, years)
+
+
+class RegionIndex:
+    # Row offsets of a browser table by region and by (region, year), built once so a
+    # lookup is a dict access plus one positional slice. Regions are matched exactly on
+    # the part of the description before the ':' ("Washington" no longer matches any
+    # description that merely contains the word).
+    __slots__ = ('table', 'category_column', 'region_rows', 'region_year_rows')
+
+    _no_rows = np.array([], dtype=np.intp)
+
+    def __init__(self, table, category_column):
+        self.table = table
+        self.category_column = category_column
+        self.region_rows = table.groupby('Region', sort=False).indices
+        self.region_year_rows = table.groupby(['Region', 'Date'], sort=False).indices
+
+    def regions(self):
+        return list(self.region_rows)
+
+    def rows(self, region, year=None):
+        if year is None:
+            positions = self.region_rows.get(region, self._no_rows)
+        else:
+            positions = self.region_year_rows.get((region, year), self._no_rows)
+        return self.table.iloc[positions]
+
+
+def _cached_index(kind, path, load_table, category_column):
+    key = (kind, os.path.abspath(path))
+    if key not in _index_cache:
+        _index_cache[key] = RegionIndex(load_table(path), category_column)
+    return _index_cache[key]
+
+
+def electricity_sales_index(path):
+    return _cached_index('electricity_sales', path, load_electricity_sales_table, 'Sector')
+
+
+def electricity_generation_index(path):
+    return _cached_index('electricity_generation', path, load_electricity_generation_table, 'Source')
+
+
+def electricity_sales_monthly_index(path):
+    return _cached_index('electricity_sales_monthly', path, load_electricity_sales_monthly_table, 'Sector')
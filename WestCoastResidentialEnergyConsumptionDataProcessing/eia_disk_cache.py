@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+from instrumentation import stage, count
+
+# Persistent cache of the normalized EIA tables, stored as uncompressed Feather
+# (Arrow IPC) files in a folder next to USEIA_Data/ so warm starts can memory-map
+# them instead of re-parsing the CSVs. Each entry is keyed by the size, mtime and
+# content hash of its source file; a touched but unchanged download only refreshes
+# the manifest, a changed one rebuilds that table, or, when the loader passes an
+# update function, has the newly published periods appended to it.
+#
+# pyarrow is optional: without it every call here falls through to a normal parse.
+
+manifest_file_name = 'manifest.json'
+cache_format_version = 2
+
+
+def cache_folder_for(path_to_source):
+    data_folder = os.path.dirname(os.path.abspath(path_to_source))
+    return os.path.join(os.path.dirname(data_folder), os.path.basename(data_folder) + '_cache')
+
+
+def file_fingerprint(path, with_hash=True):
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+
+def _read_manifest(cache_folder):
+    try:
+        with open(os.path.join(cache_folder, manifest_file_name)) as manifest:
+            entries = json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+    if entries.get('version') != cache_format_version:
+        return {}
+    return entries
+
+
+def _write_manifest(cache_folder, entries):
+    entries['version'] = cache_format_version
+    temporary_path = os.path.join(cache_folder, manifest_file_name + '.tmp')
+    with open(temporary_path, 'w') as manifest:
+        json.dump(entries, manifest, indent=2, sort_keys=True)
+    os.replace(temporary_path, os.path.join(cache_folder, manifest_file_name))
+
+
+def _entry_key(kind, path_to_source):
+    return f'{kind}:{os.path.basename(path_to_source)}'
+
+
+def _cache_file_name(kind, sha256):
+    return f'{kind}_{sha256[:16]}.feather'
+
+
+def load_or_build(kind, path_to_source, normalize, update=None):
+    # update(stored_table, path) returns the stored table brought up to date with the
+    # changed source, or None when it has to be rebuilt with normalize(path) instead
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        return normalize(path_to_source)
+
+    cache_folder = cache_folder_for(path_to_source)
+    entries = _read_manifest(cache_folder)
+    key = _entry_key(kind, path_to_source)
+    entry = entries.get(key)
+
+    # Size and mtime match: trust the entry without hashing the source again
+    stale_entry = None
+    fingerprint = file_fingerprint(path_to_source, with_hash=False)
+    if entry is None or entry['size'] != fingerprint['size'] or entry['mtime_ns'] != fingerprint['mtime_ns']:
+        fingerprint = file_fingerprint(path_to_source)
+        if entry is not None and entry['sha256'] == fingerprint['sha256']:
+            # Touched (e.g. re-downloaded) but the content is identical
+            entry.update(size=fingerprint['size'], mtime_ns=fingerprint['mtime_ns'])
+            _write_manifest(cache_folder, entries)
+        else:
+            stale_entry, entry = entry, None
+
+    if entry is not None:
+        cache_path = os.path.join(cache_folder, entry['cache_file'])
+        if os.path.exists(cache_path):
+            with stage('read_feather', path_to_source):
+                count(bytes_read=os.path.getsize(cache_path))
+                return feather.read_table(cache_path, memory_map=True).to_pandas()
+
+    table = None
+    if update is not None and stale_entry is not None:
+        stale_path = os.path.join(cache_folder, stale_entry['cache_file'])
+        if os.path.exists(stale_path):
+            with stage('append_update', path_to_source):
+                table = update(feather.read_table(stale_path).to_pandas(), path_to_source)
+    if table is None:
+        table = normalize(path_to_source)
+
+    os.makedirs(cache_folder, exist_ok=True)
+    cache_file = _cache_file_name(kind, fingerprint['sha256'])
+    temporary_path = os.path.join(cache_folder, cache_file + '.tmp')
+    feather.write_feather(table.reset_index(drop=True), temporary_path, compression='uncompressed')
+    os.replace(temporary_path, os.path.join(cache_folder, cache_file))
+
+    # Drop the file for the previous version of this source
+    if key in entries and entries[key]['cache_file'] != cache_file:
+        stale_path = os.path.join(cache_folder, entries[key]['cache_file'])
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    entries[key] = dict(fingerprint, cache_file=cache_file, years=_years_in(table))
+    _write_manifest(cache_folder, entries)
+    return table
+
+
+def _years_in(table):
+    # Kept in the manifest so the years on hand can be listed without loading pandas
+    if 'Date' not in table.columns:
+        return []
+    return sorted({int(str(date)[:4]) for date in table['Date'].unique()})
+
+
+def _fresh_entry(kind, path_to_source):
+    # The manifest entry when its size and mtime still match the source, otherwise None
+    entry = _read_manifest(cache_folder_for(path_to_source)).get(_entry_key(kind, path_to_source))
+    if entry is None or not os.path.exists(path_to_source):
+        return None
+    fingerprint = file_fingerprint(path_to_source, with_hash=False)
+    if entry['size'] != fingerprint['size'] or entry['mtime_ns'] != fingerprint['mtime_ns']:
+        return None
+    return entry
+
+
+def is_fresh(kind, path_to_source):
+    # An up-to-date entry whose cache file is still there, checked without parsing or hashing
+    entry = _fresh_entry(kind, path_to_source)
+    return entry is not None and os.path.exists(os.path.join(cache_folder_for(path_to_source), entry['cache_file']))
+
+
+def cached_years(kind, path_to_source):
+    # Years recorded for an up-to-date cache entry, None when the entry is missing or stale
+    entry = _fresh_entry(kind, path_to_source)
+    return None if entry is None else entry.get('years')
+
+
+def load_if_fresh(kind, path_to_source, filters=None):
+    # The cached table when it is up to date, None (never a parse) otherwise. filters
+    # ({column: values}, 'Date' matched on its year) are applied to the memory-mapped
+    # Arrow table, so only the selected rows are ever converted to pandas
+    entry = _fresh_entry(kind, path_to_source)
+    if entry is None:
+        return None
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.feather as feather
+    except ImportError:
+        return None
+    cache_path = os.path.join(cache_folder_for(path_to_source), entry['cache_file'])
+    if not os.path.exists(cache_path):
+        return None
+    with stage('read_feather', path_to_source):
+        table = feather.read_table(cache_path, memory_map=True)
+        for column, values in (filters or {}).items():
+            if values is None:
+                continue
+            data = table[column]
+            if column == 'Date' and pa.types.is_timestamp(data.type):
+                data = pc.year(data)
+            table = table.filter(pc.is_in(data, value_set=pa.array(list(values), type=data.type)))
+        count(bytes_read=table.nbytes)
+        return table.to_pandas()
+
+
+def stored_table(kind, path_to_source):
+    # The cached table of whatever version of the source was stored last, fresh or not,
+    # None when nothing is cached. Read only; load_or_build does all the writing
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        return None
+    entry = _read_manifest(cache_folder_for(path_to_source)).get(_entry_key(kind, path_to_source))
+    if entry is None:
+        return None
+    cache_path = os.path.join(cache_folder_for(path_to_source), entry['cache_file'])
+    if not os.path.exists(cache_path):
+        return None
+    return feather.read_table(cache_path).to_pandas()
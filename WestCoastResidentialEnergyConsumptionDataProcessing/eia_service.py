@@ -0,0 +1,318 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+import eia_data_loader
+from eia_disk_cache import file_fingerprint
+from sector_records import SectorTable
+from regions import (region_registry, available_regions, natural_gas_source_regions, find_region, has_electricity_data,
+                     parse_years)
+
+# Local HTTP/JSON service for the numbers behind the pie charts. The normalized EIA
+# tables are loaded once into plain nested dicts ({region: {year: {sector: value}}}),
+# so answering a query never touches pandas, and encoded responses are kept in a
+# bounded LRU cache under both the raw query string and its normalized form. The
+# source files are polled; when one changes the store is rebuilt in a worker thread
+# and swapped in, and the result cache is dropped.
+#
+#   python eia_cli.py serve --port 8765
+#   curl 'http://127.0.0.1:8765/query?dataset=allocated&regions=WA,OR&years=2016-2020&sectors=Residential'
+#
+# GET /query   dataset   natural-gas, electricity or allocated (default)
+#              regions   comma separated names, values or abbreviations (default: all)
+#              years     e.g. 2016,2020-2023 (default: all)
+#              sectors   comma separated columns to keep (default: all, or the pie chart's wedges with shares)
+#              combine   1/0, fold '<Sector> Electricity' into '<Sector>' (allocated only, default 1)
+#              shares    1/0, fractions of the matching pie chart's total instead of absolute values
+# GET /regions, GET /health
+
+datasets = ['natural-gas', 'electricity', 'allocated']
+dataset_units = {'natural-gas': 'MMcf', 'electricity': 'thousand megawatthours', 'allocated': 'MMcf'}
+
+# The wedges of the matching pie chart, shares are fractions of their sum
+end_use_sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
+pie_chart_sectors = {
+    'natural-gas': ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Electric Power'],
+    'electricity': end_use_sectors,
+    ('allocated', True): end_use_sectors,
+    ('allocated', False): [column for sector in end_use_sectors for column in (sector, sector + ' Electricity')],
+}
+
+
+class LRUCache:
+    __slots__ = ('maxsize', 'hits', 'misses', '_entries')
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class EnergyStore:
+    # tables[dataset or (allocated, combine)][region name][year] -> {sector: value}
+    __slots__ = ('tables', 'regions', 'years', 'sources', 'loaded_at')
+
+    def __init__(self, tables, regions, years, sources):
+        self.tables = tables
+        self.regions = regions
+        self.years = years
+        self.sources = sources
+        self.loaded_at = time.time()
+
+
+def _nested(records):
+    # (Region, Date)-keyed SectorTable -> {region name: {year: {sector: value}}}, missing values
+    # (NaN) become None so they go out as JSON null
+    nested = {}
+    for record in records.records():
+        region, year = record.key
+        nested.setdefault(region.name, {})[int(year)] = {sector: None if value != value else value
+                                                          for sector, value in record.as_dict().items()}
+    return nested
+
+
+def source_paths(regions):
+    paths = {pipeline.retail_sales_of_electricity_path}
+    for region in regions:
+        paths.update(pipeline.ng_data_path_dict[source] for source in natural_gas_source_regions(region))
+    return sorted(paths)
+
+
+def source_fingerprints(paths):
+    return {path: file_fingerprint(path, with_hash=False) for path in paths}
+
+
+def build_store():
+    published = set(pipeline.electricity_sales_index(pipeline.retail_sales_of_electricity_path).regions())
+    regions = [region for region in available_regions(pipeline.data_folder) if has_electricity_data(region, published)]
+    sources = source_paths(regions)
+    fingerprints = source_fingerprints(sources)
+    eia_data_loader.ingest_sources([(eia_data_loader.source_kind(path), path) for path in sources])
+
+    ng_records = SectorTable.from_frame(pipeline.natural_gas_data_by_region(regions))
+    electricity_records = SectorTable.from_frame(pipeline.electricity_data_by_region(regions))
+    tables = {
+        'natural-gas': _nested(ng_records),
+        'electricity': _nested(electricity_records),
+        ('allocated', True): _nested(pipeline.allocate_ng_records(ng_records, electricity_records, True)),
+        ('allocated', False): _nested(pipeline.allocate_ng_records(ng_records, electricity_records, False)),
+    }
+    years = sorted({int(year) for year in ng_records.index.get_level_values('Date')})
+    return EnergyStore(tables, [region.name for region in regions], years, fingerprints)
+
+
+def _flag(values, name, default):
+    value = values.get(name, [str(int(default))])[-1].lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be 1 or 0, not {value}')
+
+
+# Every spelling find_region accepts, lower-cased
+region_aliases = {}
+for _region, _info in region_registry.items():
+    for _alias in (_region.name, _region.value, _info.abbreviation):
+        if _alias:
+            region_aliases[_alias.lower()] = _region.name
+
+
+def _region_name(name):
+    try:
+        return region_aliases[name.strip().lower()]
+    except KeyError:
+        raise ValueError(f'Unknown region: {name}') from None
+
+
+def query_key(store, values):
+    # Normalized so equivalent queries ("WA" and "Washington", "2016-2017" and "2017,2016") share a cache entry
+    dataset = values.get('dataset', ['allocated'])[-1]
+    if dataset not in datasets:
+        raise ValueError(f'dataset must be one of {", ".join(datasets)}')
+    if 'regions' in values:
+        regions = tuple(sorted({_region_name(name) for name in values['regions'][-1].split(',') if name.strip()}))
+        missing = [name for name in regions if name not in store.regions]
+        if missing:
+            raise ValueError(f'No data for {", ".join(missing)}')
+    else:
+        regions = tuple(store.regions)
+    years = tuple(parse_years(values['years'][-1], store.years)) if 'years' in values else tuple(store.years)
+    sectors = tuple(sector.strip() for sector in values['sectors'][-1].split(',')) if 'sectors' in values else None
+    combine = _flag(values, 'combine', True) if dataset == 'allocated' else None
+    return dataset, regions, years, sectors, combine, _flag(values, 'shares', False)
+
+
+def answer_query(store, key):
+    dataset, regions, years, sectors, combine, shares = key
+    table_key = ('allocated', combine) if dataset == 'allocated' else dataset
+    table = store.tables[table_key]
+    if shares and sectors is None:
+        sectors = pie_chart_sectors[table_key]
+    data = {}
+    for region in regions:
+        rows = table[region]
+        data[region] = region_data = {}
+        for year in years:
+            row = rows.get(year)
+            if row is None:
+                continue
+            if shares:
+                # Missing values (None) count as nothing in the total and stay missing
+                total = sum(row.get(sector) or 0.0 for sector in pie_chart_sectors[table_key])
+                row = {sector: None if value is None else value / total if total else 0.0
+                       for sector, value in row.items()}
+            if sectors is not None:
+                unknown = [sector for sector in sectors if sector not in row]
+                if unknown:
+                    raise ValueError(f'Unknown sector(s) for {dataset}: {", ".join(unknown)}')
+                row = {sector: row[sector] for sector in sectors}
+            region_data[str(year)] = row
+    result = {'dataset': dataset, 'units': 'share' if shares else dataset_units[dataset], 'data': data}
+    if combine is not None:
+        result['combine'] = combine
+    return result
+
+
+class QueryService:
+    def __init__(self, cache_size=1024, poll_seconds=5.0):
+        self.store = None
+        self.cache = LRUCache(cache_size)
+        self.poll_seconds = poll_seconds
+        self.reloads = 0
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        eia_data_loader.clear_table_cache()
+        # Built off the event loop so queries keep being served from the old store meanwhile
+        store = await loop.run_in_executor(None, build_store)
+        self.store = store
+        self.cache.clear()
+        self.reloads += 1
+
+    async def watch_sources(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                current = await loop.run_in_executor(None, source_fingerprints, list(self.store.sources))
+            except OSError:
+                # Mid-download or briefly missing, try again on the next poll
+                continue
+            if current != self.store.sources:
+                try:
+                    await self.load()
+                except Exception as error:
+                    print(f'Reload failed, still serving the previous data: {error}')
+
+    def handle(self, method, target):
+        if method != 'GET':
+            return 405, {'error': 'Only GET is supported'}
+        url = urlsplit(target)
+        if url.path == '/query':
+            # Repeats of the exact same query string skip parsing altogether
+            body = self.cache.get(url.query)
+            if body is not None:
+                return 200, body
+            try:
+                key = query_key(self.store, parse_qs(url.query))
+                body = self.cache.get(key)
+                if body is None:
+                    body = json.dumps(answer_query(self.store, key), allow_nan=False).encode()
+                    self.cache.put(key, body)
+            except ValueError as error:
+                return 400, {'error': str(error)}
+            except Exception as error:
+                # Still a JSON answer, and the connection stays usable
+                return 500, {'error': f'{type(error).__name__}: {error}'}
+            self.cache.put(url.query, body)
+            return 200, body
+        if url.path == '/regions':
+            return 200, {'regions': [{'name': name, 'print_name': pipeline.print_region_string[find_region(name)]}
+                                     for name in self.store.regions], 'years': self.store.years}
+        if url.path == '/health':
+            return 200, {'loaded_at': self.store.loaded_at, 'reloads': self.reloads, 'sources': list(self.store.sources),
+                         'cache': self.cache.stats()}
+        return 404, {'error': f'No such endpoint: {url.path}'}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if 'content-length' in headers:
+                    await reader.readexactly(int(headers['content-length']))
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, body = 400, {'error': 'Malformed request line'}
+                    method, version = None, 'HTTP/1.0'
+                else:
+                    started = time.perf_counter()
+                    status, body = self.handle(method, target)
+                if not isinstance(body, bytes):
+                    body = json.dumps(body, allow_nan=False).encode()
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close') and method
+                elapsed_us = (time.perf_counter() - started) * 1e6 if method else 0
+                writer.write(f'HTTP/1.1 {status} {http_reasons[status]}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                             f'X-Query-Time-us: {elapsed_us:.1f}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+http_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+async def serve(host='127.0.0.1', port=8765, cache_size=1024, poll_seconds=5.0):
+    service = QueryService(cache_size, poll_seconds)
+    await service.load()
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    print(f'Serving {len(service.store.regions)} regions, {service.store.years[0]}-{service.store.years[-1]} '
+          f'on http://{host}:{port}', flush=True)
+    watcher = asyncio.create_task(service.watch_sources())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
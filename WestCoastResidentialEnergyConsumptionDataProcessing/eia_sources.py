@@ -0,0 +1,34 @@
+import os
+
+# Which table each file in USEIA_Data/ holds, by file name. Kept apart from
+# eia_data_loader.py (which re-exports it) so the CLI can list the sources
+# without importing pandas.
+
+browser_source_kinds = {
+    'Retail_sales_of_electricity.csv': 'electricity_sales',
+    'Net_generation_for_all_sectors.csv': 'electricity_generation',
+    'Retail_sales_of_electricity_monthly.csv': 'electricity_sales_monthly',
+    'Net_generation_for_all_sectors_monthly.csv': 'electricity_generation_monthly',
+}
+
+
+def source_kind(path):
+    # The table kind of a file in USEIA_Data/, None for anything else
+    file_name = os.path.basename(path)
+    if file_name.startswith('NG_CONS_SUM_DCU_'):
+        if file_name.endswith('_A.csv'):
+            return 'natural_gas'
+        if file_name.endswith('_M.csv'):
+            return 'natural_gas_monthly'
+        return None
+    return browser_source_kinds.get(file_name)
+
+
+def discover_sources(data_folder):
+    # (kind, path) of every source file in the folder, sorted by file name
+    sources = []
+    for file_name in sorted(os.listdir(data_folder)):
+        kind = source_kind(file_name)
+        if kind is not None:
+            sources.append((kind, os.path.join(data_folder, file_name)))
+    return sources
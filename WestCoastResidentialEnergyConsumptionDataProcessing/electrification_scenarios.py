@@ -0,0 +1,169 @@
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+from chart_rendering import LineChartJob
+from instrumentation import instrumented, stage
+from energy_dataset import EnergyDataset
+from regions import region_registry
+
+# What-if sweeps over the natural gas allocation. The baseline natural gas, retail sales
+# and generation mix of every region-year are loaded once into (region, year) arrays;
+# a batch of scenarios is then a set of equal-length parameter vectors, and every
+# scenario's allocation comes out of one broadcast over (scenario, region, year, sector).
+#
+#   baseline = load_baseline([Region.WASHINGTON, Region.OREGON], range(2002, 2024))
+#   result = evaluate_scenarios(baseline, **scenario_grid(residential_share=np.linspace(0, 1, 21),
+#                                                          heat_pump_cop=[2.5, 3.0, 3.5],
+#                                                          renewable_share_change=[0, 0.1, 0.2]))
+#   result.values.shape   # (189, 2, 22, 5): scenario x region x year x end-use sector, MMcf
+#
+# Each scenario moves a share of the residential and commercial direct gas use to heat
+# pumps: the heat the gas furnaces delivered is supplied by electricity at the heat
+# pump's COP, added to that sector's retail sales. Gas burned for electric power scales
+# with total sales, and with the fossil share of generation after shifting
+# renewable_share_change of it to renewables (fossil fuels shrink proportionally).
+# That gas is then allocated by the scenario's sales shares like allocate_ng_records.
+
+end_use_sectors = ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel', 'Other']
+scenario_parameters = ['residential_share', 'commercial_share', 'heat_pump_cop', 'furnace_efficiency',
+                       'renewable_share_change']
+default_parameters = {'residential_share': 0.0, 'commercial_share': 0.0, 'heat_pump_cop': 3.0,
+                      'furnace_efficiency': 0.9, 'renewable_share_change': 0.0}
+
+# Thousand MWh of heat per MMcf of gas burned at 100% efficiency (1,036 MMBtu/MMcf, 0.293071 MWh/MMBtu)
+thousand_mwh_per_mmcf = 1036 * 0.293071 / 1000
+
+# natural_gas and sales are (region, year, sector) arrays in the order of their sector lists
+ScenarioBaseline = namedtuple('ScenarioBaseline', ['regions', 'years', 'natural_gas', 'natural_gas_sectors',
+                                                   'sales', 'sales_sectors', 'fossil_share'])
+# values is (scenario, region, year, sector) in MMcf, parameters {name: (scenario,) array}
+ScenarioResult = namedtuple('ScenarioResult', ['values', 'parameters', 'regions', 'years', 'sectors'])
+
+
+def _grid(records, regions, years, sectors):
+    # (region, year, sector) array of a (Region, Date) SectorTable, zeros where a region-year is missing
+    keys = [(region, year) for region in regions for year in years]
+    return records.aligned(keys, sectors).reshape(len(regions), len(years), len(sectors))
+
+
+@instrumented('load_baseline')
+def load_baseline(regions, years, dataset=None):
+    # Everything a sweep needs, read once: only the selected years of the natural gas and
+    # retail sales files (see EnergyDataset), plus the generation mix
+    import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+
+    regions = list(regions)
+    years = sorted(set(int(year) for year in years))
+    dataset = (dataset or EnergyDataset()).annual().region(regions).years(years)
+    natural_gas = dataset.natural_gas().collect()
+    sales = dataset.electricity().collect()
+    generation_mix = pipeline.generation_mix_records_by_region(regions)
+
+    natural_gas_sectors = [sector for sector in end_use_sectors + ['Electric Power'] if sector in natural_gas.columns]
+    sales_sectors = [sector for sector in sales.sectors if sector != 'Total Delivered']
+    fossil = _grid(generation_mix, regions, years, ['Fossil Fuels', 'Total Generated'
+                                                     if 'Total Generated' in generation_mix.columns
+                                                     else 'all fuels (utility-scale)'])
+    fossil_share = np.divide(fossil[..., 0], fossil[..., 1], out=np.zeros(fossil.shape[:2]), where=fossil[..., 1] > 0)
+    return ScenarioBaseline(regions, years, _grid(natural_gas, regions, years, natural_gas_sectors), natural_gas_sectors,
+                            _grid(sales, regions, years, sales_sectors), sales_sectors, fossil_share)
+
+
+def scenario_grid(**parameter_values):
+    # Every combination of the given values, as equal-length parameter vectors for evaluate_scenarios
+    names = list(parameter_values)
+    combinations = list(itertools.product(*(np.atleast_1d(parameter_values[name]) for name in names)))
+    return {name: np.array([combination[position] for combination in combinations], dtype=float)
+            for position, name in enumerate(names)}
+
+
+@instrumented('evaluate_scenarios')
+def evaluate_scenarios(baseline, **parameters):
+    # parameters are scalars or (scenario,) arrays named as in scenario_parameters, missing
+    # ones take default_parameters. Returns a ScenarioResult
+    unknown = [name for name in parameters if name not in scenario_parameters]
+    if unknown:
+        raise ValueError(f'Unknown scenario parameter(s): {", ".join(unknown)}')
+    vectors = {name: np.atleast_1d(np.asarray(parameters.get(name, default_parameters[name]), dtype=float))
+               for name in scenario_parameters}
+    scenario_count = max(len(vector) for vector in vectors.values())
+    vectors = {name: np.broadcast_to(vector, (scenario_count,)) for name, vector in vectors.items()}
+    # (scenario, 1, 1) so they broadcast against (region, year)
+    p = {name: vector[:, None, None] for name, vector in vectors.items()}
+
+    ng_column = {sector: position for position, sector in enumerate(baseline.natural_gas_sectors)}
+    sales_column = {sector: position for position, sector in enumerate(baseline.sales_sectors)}
+    natural_gas, sales = baseline.natural_gas, baseline.sales
+
+    with stage('broadcast'):
+        # Direct gas per end-use sector, (scenario, region, year, sector)
+        direct = np.zeros((scenario_count,) + natural_gas.shape[:2] + (len(end_use_sectors),))
+        scenario_sales = np.broadcast_to(sales, direct.shape[:3] + (sales.shape[2],)).copy()
+        for position, sector in enumerate(end_use_sectors):
+            if sector in ng_column:
+                direct[..., position] = natural_gas[..., ng_column[sector]]
+
+        for sector, share in (('Residential', p['residential_share']), ('Commercial', p['commercial_share'])):
+            if sector not in ng_column:
+                continue
+            moved = share * natural_gas[..., ng_column[sector]]
+            direct[..., end_use_sectors.index(sector)] -= moved
+            if sector in sales_column:
+                scenario_sales[..., sales_column[sector]] += (moved * p['furnace_efficiency'] * thousand_mwh_per_mmcf
+                                                              / p['heat_pump_cop'])
+
+        # Gas for electric power follows total sales and the remaining fossil share
+        base_total = sales.sum(axis=-1)
+        total = scenario_sales.sum(axis=-1)
+        sales_growth = np.divide(total, base_total, out=np.ones_like(total), where=base_total > 0)
+        fossil_share = baseline.fossil_share
+        new_fossil_share = np.clip(fossil_share - p['renewable_share_change'], 0, 1)
+        fossil_scale = np.divide(new_fossil_share, fossil_share, out=np.ones_like(new_fossil_share),
+                                 where=fossil_share > 0)
+        electric_power = natural_gas[..., ng_column['Electric Power']] * sales_growth * fossil_scale
+
+        # Allocated by the scenario's sales shares, as allocate_ng_records does with combine=True
+        shares = np.divide(scenario_sales, total[..., None], out=np.zeros_like(scenario_sales), where=total[..., None] > 0)
+        values = direct
+        for sector, position in sales_column.items():
+            if sector in end_use_sectors:
+                values[..., end_use_sectors.index(sector)] += shares[..., position] * electric_power
+
+    return ScenarioResult(values, {name: np.array(vector) for name, vector in vectors.items()},
+                          baseline.regions, baseline.years, list(end_use_sectors))
+
+
+def scenario_totals(result, sectors=None):
+    # (scenario, region, year) gas use summed over the sectors (default: all of them)
+    if sectors is None:
+        return result.values.sum(axis=3)
+    return result.values[..., [result.sectors.index(sector) for sector in sectors]].sum(axis=3)
+
+
+sweep_colors = ['blue', 'green', 'red', 'purple', 'orange', 'brown', 'gray', 'olive', 'cyan', 'pink']
+
+
+def scenario_sweep_chart_job(result, region, year, x_parameter, series_parameter=None, sectors=None,
+                             save_folder='../', print_name=None):
+    # Gas use of one region-year against x_parameter, one line per value of series_parameter;
+    # scenarios sharing both values (e.g. differing in an unplotted parameter) are averaged
+    totals = scenario_totals(result, sectors)[:, result.regions.index(region), result.years.index(year)]
+    x_values = result.parameters[x_parameter]
+    x = sorted(set(x_values.tolist()))
+    groups = sorted(set(result.parameters[series_parameter].tolist())) if series_parameter else [None]
+
+    series = {}
+    colors = {}
+    for number, group in enumerate(groups):
+        in_group = np.ones(len(totals), dtype=bool) if group is None else result.parameters[series_parameter] == group
+        label = f'{series_parameter} = {group:g}' if series_parameter else 'Natural gas use'
+        series[label] = [float(totals[in_group & (x_values == value)].mean()) for value in x]
+        colors[label] = sweep_colors[number % len(sweep_colors)]
+
+    name = print_name or region_registry[region].print_name
+    used_by = ', '.join(sectors) if sectors else 'all sectors'
+    title = f'Natural Gas Use ({used_by}) by {x_parameter} in {name} ({year})'
+    ticks = x[::max(1, len(x) // 10)]
+    return LineChartJob(title, save_folder + title, x, series, colors, ticks, x_parameter, '(MMcf)', (10, 5))
@@ -0,0 +1,194 @@
+from instrumentation import instrumented
+from regions import (Region, region_registry, natural_gas_source_regions, natural_gas_data_path, available_regions,
+                     find_region)
+from sector_records import SectorTable
+from eia_data_loader import (RegionIndex, natural_gas_sector_keywords, scan_natural_gas_table, scan_electricity_sales_table,
+                             scan_electricity_generation_table)
+
+# Lazy selection over the EIA sources. Each selector returns a new EnergyDataset with a
+# narrower plan and nothing is read until .collect(), which loads only the slice the
+# plan asks for: the natural gas files of the selected regions' states, parsing just the
+# selected sector columns (plus Electric Power when allocating), just the selected
+# years, and just the selected locations' rows and year columns of the retail sales
+# export. Tables already loaded in memory or in the disk cache are filtered instead.
+#
+#   dataset = EnergyDataset().region('WA', 'OR').years(range(2016, 2024)).sectors('Residential').allocated()
+#   dataset.collect()   # SectorTable indexed by (Region, Date), see sector_records.py
+#   residential_energy_use_over_time(2016, 2023, Region.WASHINGTON, dataset=dataset.monthly())
+#
+# Allocating needs every electricity sector of a region-year for the percentages, so
+# only the sectors of the natural gas side are pruned there. With emissions the selected
+# locations and years of the generation file are read as well.
+
+natural_gas_sectors = list(natural_gas_sector_keywords.values())
+dataset_sources = ['natural-gas', 'electricity', 'allocated']
+
+
+def _pipeline():
+    # The pipeline module imports this one, so it is only looked up once data is needed
+    import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+    return pipeline
+
+
+def _flatten(values):
+    flat = []
+    for value in values:
+        if isinstance(value, (int, str, Region)):
+            flat.append(value)
+        else:
+            flat.extend(value)
+    return flat
+
+
+def _electricity_locations(regions):
+    # Descriptions to keep from the retail sales export: each region and, for composites
+    # that are not published themselves, the members they get summed from
+    locations = set()
+    pending = list(regions)
+    while pending:
+        info = region_registry[pending.pop()]
+        locations.add(info.electricity_name)
+        pending.extend(info.members)
+    return locations
+
+
+class EnergyDataset:
+    __slots__ = ('_source', '_regions', '_years', '_sectors', '_combine', '_emissions', '_frequency')
+
+    def __init__(self, source='natural-gas', regions=None, years=None, sectors=None, combine=True, emissions=False,
+                 frequency='A'):
+        # None selects everything on hand
+        if source not in dataset_sources:
+            raise ValueError(f'source must be one of {", ".join(dataset_sources)}')
+        self._source = source
+        self._regions = regions
+        self._years = years
+        self._sectors = sectors
+        self._combine = combine
+        self._emissions = emissions
+        self._frequency = frequency
+
+    def _with(self, **changes):
+        plan = {'source': self._source, 'regions': self._regions, 'years': self._years, 'sectors': self._sectors,
+                'combine': self._combine, 'emissions': self._emissions, 'frequency': self._frequency}
+        plan.update(changes)
+        return EnergyDataset(**plan)
+
+    def __repr__(self):
+        return (f'EnergyDataset({self._source!r}, regions={self._regions}, years={self._years}, '
+                f'sectors={self._sectors}, combine={self._combine}, emissions={self._emissions}, '
+                f'frequency={self._frequency!r})')
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    def region(self, *regions):
+        # Region members or anything find_region accepts ('WA', 'West Coast', 'WEST_COAST')
+        return self._with(regions=tuple(region if isinstance(region, Region) else find_region(region)
+                                        for region in _flatten(regions)))
+
+    def years(self, *years):
+        # Years or iterables of them, e.g. .years(2016) or .years(range(2002, 2024)). With
+        # .monthly() every month of the years is selected
+        return self._with(years=tuple(sorted({int(year) for year in _flatten(years)})))
+
+    def sectors(self, *sectors):
+        return self._with(sectors=tuple(_flatten(sectors)))
+
+    def natural_gas(self):
+        return self._with(source='natural-gas')
+
+    def electricity(self):
+        return self._with(source='electricity')
+
+    def allocated(self, combine=True, emissions=False):
+        # Natural gas with the gas burned for electric power allocated to the sectors using
+        # the electricity, combined into them or kept as '<Sector> Electricity'. emissions adds
+        # '<Sector> Electricity CO2' at each year's generation mix (for every selected sector)
+        return self._with(source='allocated', combine=combine, emissions=emissions)
+
+    def monthly(self):
+        return self._with(frequency='M')
+
+    def annual(self):
+        return self._with(frequency='A')
+
+    def _natural_gas_columns(self):
+        if self._sectors is None:
+            return None
+        if self._source == 'natural-gas':
+            unknown = [sector for sector in self._sectors if sector not in natural_gas_sectors]
+            if unknown:
+                raise KeyError(f'Not a natural gas sector: {", ".join(unknown)}')
+        wanted = set(self._sectors)
+        if self._source == 'allocated':
+            wanted.add('Electric Power')
+        return [sector for sector in natural_gas_sectors if sector in wanted]
+
+    def plan(self):
+        # (source file, what gets read from it) for every file .collect() would touch
+        pipeline = _pipeline()
+        regions = self._selected_regions(pipeline)
+        years = 'all years' if self._years is None else f'years {self._years[0]}-{self._years[-1]}'
+        steps = []
+        if self._source != 'electricity':
+            columns = self._natural_gas_columns() or natural_gas_sectors
+            sources = sorted({source for region in regions for source in natural_gas_source_regions(region)},
+                             key=lambda source: source.name)
+            for source in sources:
+                steps.append((natural_gas_data_path(source, pipeline.data_folder, self._frequency),
+                              f'{", ".join(columns)}; {years}'))
+        locations = ", ".join(sorted(_electricity_locations(regions)))
+        if self._source != 'natural-gas':
+            steps.append((self._electricity_path(pipeline), f'rows of {locations}; {years}'))
+        if self._source == 'allocated' and self._emissions:
+            steps.append((pipeline.net_generation_for_all_sectors_path, f'rows of {locations}; {years}'))
+        return steps
+
+    def _selected_regions(self, pipeline):
+        if self._regions is not None:
+            return list(self._regions)
+        return available_regions(pipeline.data_folder, self._frequency)
+
+    def _electricity_path(self, pipeline):
+        if self._frequency == 'M':
+            return pipeline.retail_sales_of_electricity_monthly_path
+        return pipeline.retail_sales_of_electricity_path
+
+    @instrumented('EnergyDataset.collect')
+    def collect(self):
+        # A SectorTable indexed by (Region, Date) with the selected sectors as columns, in the order given
+        pipeline = _pipeline()
+        regions = self._selected_regions(pipeline)
+        monthly = self._frequency == 'M'
+
+        if self._source != 'electricity':
+            columns = self._natural_gas_columns()
+            ng_data = pipeline.natural_gas_data_by_region(
+                regions, self._frequency, columns,
+                lambda source: scan_natural_gas_table(natural_gas_data_path(source, pipeline.data_folder, self._frequency),
+                                                      columns, self._years, monthly))
+            records = ng_records = SectorTable.from_frame(ng_data)
+        if self._source != 'natural-gas':
+            sales = scan_electricity_sales_table(self._electricity_path(pipeline), _electricity_locations(regions),
+                                                 self._years, monthly)
+            electricity_data = pipeline.electricity_data_by_region(regions, self._frequency, RegionIndex(sales, 'Sector'))
+            records = electricity_records = SectorTable.from_frame(electricity_data)
+        if self._source == 'allocated':
+            generation_mix = None
+            if self._emissions:
+                # Annual file, monthly rows use their year's mix
+                generation = scan_electricity_generation_table(pipeline.net_generation_for_all_sectors_path,
+                                                               _electricity_locations(regions), self._years)
+                generation_mix = pipeline.generation_mix_records(SectorTable.from_frame(
+                    pipeline.electricity_generation_data_by_region(regions, RegionIndex(generation, 'Source'))))
+            records = pipeline.allocate_ng_records(ng_records, electricity_records, self._combine, generation_mix)
+
+        if self._sectors is None:
+            return records
+        sectors = list(self._sectors)
+        if self._source == 'allocated' and self._emissions:
+            sectors += [sector + ' Electricity CO2' for sector in self._sectors
+                        if sector + ' Electricity CO2' in records.columns]
+        return SectorTable(records.index, sectors, records.columns_for(sectors))
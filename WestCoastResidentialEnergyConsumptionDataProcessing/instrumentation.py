@@ -0,0 +1,146 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Opt-in timing and counters for the parse, allocate and render stages. Every
+# instrumented call is recorded per (stage, region) with its wall time, call count,
+# rows processed, bytes read and figures written, and as a complete event in the
+# Chrome trace format, so write_trace() output loads straight into chrome://tracing
+# or https://ui.perfetto.dev.
+#
+# Disabled by default: the decorators then cost one global check per call and
+# stage() hands back a shared no-op context. Turn it on with enable(), or set
+# EIA_TRACE=trace.json to record a whole run and write it at exit.
+#
+# Charts rendered in render_charts' worker processes are only counted in the parent.
+
+enabled = False
+
+_lock = threading.Lock()
+_local = threading.local()
+_events = []
+_counters = {}
+_start = time.perf_counter()
+_no_op = nullcontext()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    global _start
+    with _lock:
+        _events.clear()
+        _counters.clear()
+        _start = time.perf_counter()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _describe_region(region):
+    if region is None:
+        return None
+    if hasattr(region, 'value') and hasattr(region, 'name'):
+        return region.value
+    if isinstance(region, str) and ('/' in region or os.sep in region):
+        return os.path.basename(region)
+    return str(region)
+
+
+def count(rows=0, bytes_read=0, figures=0):
+    # Adds to the innermost running stage
+    if not enabled:
+        return
+    stack = _stack()
+    if stack:
+        record = stack[-1]
+        record['rows'] += rows
+        record['bytes_read'] += bytes_read
+        record['figures'] += figures
+
+
+@contextmanager
+def _recorded_stage(name, region):
+    record = {'rows': 0, 'bytes_read': 0, 'figures': 0}
+    stack = _stack()
+    stack.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        with _lock:
+            totals = _counters.setdefault((name, region), {'calls': 0, 'wall_s': 0.0, 'rows': 0,
+                                                           'bytes_read': 0, 'figures': 0})
+            totals['calls'] += 1
+            totals['wall_s'] += elapsed
+            for key in ('rows', 'bytes_read', 'figures'):
+                totals[key] += record[key]
+            _events.append({
+                'name': name, 'cat': 'eia', 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': (started - _start) * 1e6, 'dur': elapsed * 1e6,
+                'args': dict(record, region=region) if region else dict(record),
+            })
+
+
+def stage(name, region=None):
+    if not enabled:
+        return _no_op
+    return _recorded_stage(name, _describe_region(region))
+
+
+def instrumented(name, region_argument=None):
+    # region_argument names the parameter that says which region/file the call is about
+    def decorate(func):
+        position = list(inspect.signature(func).parameters).index(region_argument) if region_argument else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            region = None
+            if region_argument is not None:
+                region = kwargs.get(region_argument, args[position] if position < len(args) else None)
+            with _recorded_stage(name, _describe_region(region)) as record:
+                result = func(*args, **kwargs)
+                if hasattr(result, 'shape'):
+                    record['rows'] += result.shape[0]
+                return result
+        return wrapper
+    return decorate
+
+
+def summary():
+    with _lock:
+        return [dict(stage=name, region=region, **totals) for (name, region), totals in _counters.items()]
+
+
+def write_trace(path):
+    with _lock:
+        events = list(_events)
+    trace = {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'stages': summary()}}
+    with open(path, 'w') as output:
+        json.dump(trace, output, indent=1)
+    return path
+
+
+if os.environ.get('EIA_TRACE'):
+    enable()
+    atexit.register(write_trace, os.environ['EIA_TRACE'])
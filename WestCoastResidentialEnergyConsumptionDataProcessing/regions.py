@@ -0,0 +1,199 @@
+import os
+from collections import namedtuple
+from enum import Enum
+
+# Every region the EIA sources cover: the 50 states plus DC, the census divisions used
+# by the electricity data browser, the West Coast and the United States. Composite
+# regions list their members; when a composite has no natural gas file of its own it is
+# the sum of its members (see natural_gas_data_by_region). Kept free of pandas so it is
+# cheap to import.
+
+
+class Region(Enum):
+    ALABAMA = "Alabama"
+    ALASKA = "Alaska"
+    ARIZONA = "Arizona"
+    ARKANSAS = "Arkansas"
+    CALIFORNIA = "California"
+    COLORADO = "Colorado"
+    CONNECTICUT = "Connecticut"
+    DELAWARE = "Delaware"
+    DISTRICT_OF_COLUMBIA = "District of Columbia"
+    FLORIDA = "Florida"
+    GEORGIA = "Georgia"
+    HAWAII = "Hawaii"
+    IDAHO = "Idaho"
+    ILLINOIS = "Illinois"
+    INDIANA = "Indiana"
+    IOWA = "Iowa"
+    KANSAS = "Kansas"
+    KENTUCKY = "Kentucky"
+    LOUISIANA = "Louisiana"
+    MAINE = "Maine"
+    MARYLAND = "Maryland"
+    MASSACHUSETTS = "Massachusetts"
+    MICHIGAN = "Michigan"
+    MINNESOTA = "Minnesota"
+    MISSISSIPPI = "Mississippi"
+    MISSOURI = "Missouri"
+    MONTANA = "Montana"
+    NEBRASKA = "Nebraska"
+    NEVADA = "Nevada"
+    NEW_HAMPSHIRE = "New Hampshire"
+    NEW_JERSEY = "New Jersey"
+    NEW_MEXICO = "New Mexico"
+    NEW_YORK = "New York"
+    NORTH_CAROLINA = "North Carolina"
+    NORTH_DAKOTA = "North Dakota"
+    OHIO = "Ohio"
+    OKLAHOMA = "Oklahoma"
+    OREGON = "Oregon"
+    PENNSYLVANIA = "Pennsylvania"
+    RHODE_ISLAND = "Rhode Island"
+    SOUTH_CAROLINA = "South Carolina"
+    SOUTH_DAKOTA = "South Dakota"
+    TENNESSEE = "Tennessee"
+    TEXAS = "Texas"
+    UTAH = "Utah"
+    VERMONT = "Vermont"
+    VIRGINIA = "Virginia"
+    WASHINGTON = "Washington"
+    WEST_VIRGINIA = "West Virginia"
+    WISCONSIN = "Wisconsin"
+    WYOMING = "Wyoming"
+
+    # Census divisions, as named by the EIA electricity data browser
+    NEW_ENGLAND = "New England"
+    MIDDLE_ATLANTIC = "Middle Atlantic"
+    EAST_NORTH_CENTRAL = "East North Central"
+    WEST_NORTH_CENTRAL = "West North Central"
+    SOUTH_ATLANTIC = "South Atlantic"
+    EAST_SOUTH_CENTRAL = "East South Central"
+    WEST_SOUTH_CENTRAL = "West South Central"
+    MOUNTAIN = "Mountain"
+    PACIFIC_CONTIGUOUS = "Pacific Contiguous"
+    PACIFIC_NONCONTIGUOUS = "Pacific Noncontiguous"
+
+    WEST_COAST = "West Coast"
+    UNITED_STATES = "United States"
+
+
+# natural_gas_code is the XX in NG_CONS_SUM_DCU_XX_A.csv, None when the region is summed from its members
+RegionInfo = namedtuple('RegionInfo', ['abbreviation', 'natural_gas_code', 'electricity_name', 'print_name', 'members'])
+
+state_abbreviations = {
+    Region.ALABAMA: 'AL', Region.ALASKA: 'AK', Region.ARIZONA: 'AZ', Region.ARKANSAS: 'AR',
+    Region.CALIFORNIA: 'CA', Region.COLORADO: 'CO', Region.CONNECTICUT: 'CT', Region.DELAWARE: 'DE',
+    Region.DISTRICT_OF_COLUMBIA: 'DC', Region.FLORIDA: 'FL', Region.GEORGIA: 'GA', Region.HAWAII: 'HI',
+    Region.IDAHO: 'ID', Region.ILLINOIS: 'IL', Region.INDIANA: 'IN', Region.IOWA: 'IA',
+    Region.KANSAS: 'KS', Region.KENTUCKY: 'KY', Region.LOUISIANA: 'LA', Region.MAINE: 'ME',
+    Region.MARYLAND: 'MD', Region.MASSACHUSETTS: 'MA', Region.MICHIGAN: 'MI', Region.MINNESOTA: 'MN',
+    Region.MISSISSIPPI: 'MS', Region.MISSOURI: 'MO', Region.MONTANA: 'MT', Region.NEBRASKA: 'NE',
+    Region.NEVADA: 'NV', Region.NEW_HAMPSHIRE: 'NH', Region.NEW_JERSEY: 'NJ', Region.NEW_MEXICO: 'NM',
+    Region.NEW_YORK: 'NY', Region.NORTH_CAROLINA: 'NC', Region.NORTH_DAKOTA: 'ND', Region.OHIO: 'OH',
+    Region.OKLAHOMA: 'OK', Region.OREGON: 'OR', Region.PENNSYLVANIA: 'PA', Region.RHODE_ISLAND: 'RI',
+    Region.SOUTH_CAROLINA: 'SC', Region.SOUTH_DAKOTA: 'SD', Region.TENNESSEE: 'TN', Region.TEXAS: 'TX',
+    Region.UTAH: 'UT', Region.VERMONT: 'VT', Region.VIRGINIA: 'VA', Region.WASHINGTON: 'WA',
+    Region.WEST_VIRGINIA: 'WV', Region.WISCONSIN: 'WI', Region.WYOMING: 'WY',
+}
+
+division_members = {
+    Region.NEW_ENGLAND: ('CT', 'ME', 'MA', 'NH', 'RI', 'VT'),
+    Region.MIDDLE_ATLANTIC: ('NJ', 'NY', 'PA'),
+    Region.EAST_NORTH_CENTRAL: ('IL', 'IN', 'MI', 'OH', 'WI'),
+    Region.WEST_NORTH_CENTRAL: ('IA', 'KS', 'MN', 'MO', 'NE', 'ND', 'SD'),
+    Region.SOUTH_ATLANTIC: ('DE', 'DC', 'FL', 'GA', 'MD', 'NC', 'SC', 'VA', 'WV'),
+    Region.EAST_SOUTH_CENTRAL: ('AL', 'KY', 'MS', 'TN'),
+    Region.WEST_SOUTH_CENTRAL: ('AR', 'LA', 'OK', 'TX'),
+    Region.MOUNTAIN: ('AZ', 'CO', 'ID', 'MT', 'NV', 'NM', 'UT', 'WY'),
+    Region.PACIFIC_CONTIGUOUS: ('CA', 'OR', 'WA'),
+    Region.PACIFIC_NONCONTIGUOUS: ('AK', 'HI'),
+}
+
+
+def _build_registry():
+    by_abbreviation = {abbreviation: region for region, abbreviation in state_abbreviations.items()}
+    registry = {}
+    for region, abbreviation in state_abbreviations.items():
+        registry[region] = RegionInfo(abbreviation, 'S' + abbreviation, region.value, region.value, ())
+    for region, members in division_members.items():
+        registry[region] = RegionInfo(None, None, region.value, region.value,
+                                      tuple(by_abbreviation[member] for member in members))
+    registry[Region.WEST_COAST] = RegionInfo(
+        None, None, "Pacific Contiguous", "The West Coast",
+        (Region.WASHINGTON, Region.OREGON, Region.CALIFORNIA))
+    # The US has its own natural gas file, its divisions only describe the hierarchy
+    registry[Region.UNITED_STATES] = RegionInfo(
+        'US', 'NUS', "United States", "The United States", tuple(division_members))
+    return registry
+
+
+region_registry = _build_registry()
+
+
+def state_regions():
+    return [region for region, info in region_registry.items() if not info.members]
+
+
+def composite_regions():
+    return [region for region, info in region_registry.items() if info.members]
+
+
+def natural_gas_source_regions(region):
+    # The regions whose natural gas files have to be summed to get this region
+    info = region_registry[region]
+    if info.natural_gas_code is not None:
+        return [region]
+    sources = []
+    for member in info.members:
+        sources.extend(natural_gas_source_regions(member))
+    return sources
+
+
+def natural_gas_data_path(region, data_folder='USEIA_Data', frequency='A'):
+    # frequency is 'A' for the annual files, 'M' for the monthly ones
+    return f'{data_folder}/NG_CONS_SUM_DCU_{region_registry[region].natural_gas_code}_{frequency}.csv'
+
+
+def has_natural_gas_data(region, data_folder='USEIA_Data', frequency='A'):
+    return all(os.path.exists(natural_gas_data_path(source, data_folder, frequency))
+               for source in natural_gas_source_regions(region))
+
+
+def has_electricity_data(region, published_locations):
+    # Published itself in the retail sales export, or summed from members that all are
+    info = region_registry[region]
+    if info.electricity_name in published_locations:
+        return True
+    return bool(info.members) and all(has_electricity_data(member, published_locations) for member in info.members)
+
+
+def available_regions(data_folder='USEIA_Data', frequency='A'):
+    # Regions whose natural gas files (or all of their members' files) are on hand
+    return [region for region in region_registry if has_natural_gas_data(region, data_folder, frequency)]
+
+
+def find_region(name):
+    # Accepts the enum name ("WEST_COAST"), its value ("West Coast") or a state abbreviation ("WA")
+    key = name.strip()
+    for region, info in region_registry.items():
+        if key.upper() in (region.name, (info.abbreviation or '').upper()) or key.lower() == region.value.lower():
+            return region
+    raise ValueError(f'Unknown region: {name}')
+
+
+def parse_years(text, within=None):
+    # "2016", "2020-2023" or "2016,2020-2023" as a sorted list. With within (the sorted years
+    # on hand) a year or range end outside of them is rejected before any range is expanded
+    years = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first, last = int(first), int(last or first)
+        if within is not None and not (within and within[0] <= first and last <= within[-1]):
+            raise ValueError(f'Years must be within {within[0]}-{within[-1]}, not {part}' if within else
+                             'No years on hand')
+        years.update(range(first, last + 1))
+    return sorted(years)
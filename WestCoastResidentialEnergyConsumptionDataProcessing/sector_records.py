@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+# Compact interchange format between the parse, allocate and render stages. A
+# SectorTable keeps every row (one per key, e.g. (Region, Date)) of float sector values
+# in a single 2D array plus a dict from key to row, so one region-year is a dict lookup
+# and a row view instead of a one-row DataFrame with its own index and alignment.
+# DataFrames are only built at the edges: from_frame() when a table leaves the
+# loader's groupby/pivot, to_frame() and first_record() for callers that deal in pandas.
+
+
+class SectorRecord:
+    # One row of a SectorTable, record['Residential'] -> float
+    __slots__ = ('key', 'values', 'columns')
+
+    def __init__(self, key, values, columns):
+        self.key = key
+        self.values = values
+        self.columns = columns
+
+    def __getitem__(self, sector):
+        return float(self.values[self.columns[sector]])
+
+    def __contains__(self, sector):
+        return sector in self.columns
+
+    def values_for(self, sectors):
+        return [float(self.values[self.columns[sector]]) for sector in sectors]
+
+    def as_dict(self):
+        return dict(zip(self.columns, self.values.tolist()))
+
+
+class SectorTable:
+    __slots__ = ('index', 'sectors', 'values', 'columns', '_positions', '_groups')
+
+    _no_rows = np.array([], dtype=np.intp)
+
+    def __init__(self, index, sectors, values):
+        # index is shared with the frame the table came from, not copied per row
+        self.index = index
+        self.sectors = list(sectors)
+        self.values = values
+        self.columns = {sector: position for position, sector in enumerate(self.sectors)}
+        self._positions = None
+        self._groups = None
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame.index, frame.columns, frame.to_numpy(dtype=float))
+
+    def to_frame(self):
+        return pd.DataFrame(self.values, index=self.index, columns=self.sectors)
+
+    def __len__(self):
+        return len(self.values)
+
+    def positions(self):
+        if self._positions is None:
+            self._positions = {key: position for position, key in enumerate(self.index)}
+        return self._positions
+
+    def record(self, key):
+        return SectorRecord(key, self.values[self.positions()[key]], self.columns)
+
+    def records(self):
+        for key, values in zip(self.index, self.values):
+            yield SectorRecord(key, values, self.columns)
+
+    def column(self, sector):
+        return self.values[:, self.columns[sector]]
+
+    def columns_for(self, sectors):
+        return self.values[:, [self.columns[sector] for sector in sectors]]
+
+    def aligned(self, keys, sectors):
+        # The given sectors for each key, in the order of keys; zeros for missing keys and NaNs
+        positions = self.positions()
+        rows = np.fromiter((positions.get(key, -1) for key in keys), dtype=np.intp, count=len(keys))
+        aligned = np.zeros((len(rows), len(sectors)))
+        found = rows >= 0
+        aligned[found] = self.values[np.ix_(rows[found], [self.columns[sector] for sector in sectors])]
+        aligned[np.isnan(aligned)] = 0
+        return aligned
+
+    def subset(self, mask):
+        # Rows where the boolean mask is set, in the same order
+        mask = np.asarray(mask)
+        return SectorTable(self.index[mask], self.sectors, self.values[mask])
+
+    def with_columns(self, new_columns):
+        # Same rows with {sector: 1D array} added on the right
+        values = np.column_stack([self.values] + list(new_columns.values()))
+        return SectorTable(self.index, self.sectors + list(new_columns), values)
+
+    def group_rows(self, first_key):
+        # Row positions of every key starting with first_key (e.g. each year of one region)
+        if self._groups is None:
+            groups = {}
+            for position, key in enumerate(self.index):
+                groups.setdefault(key[0], []).append(position)
+            self._groups = {key: np.array(rows, dtype=np.intp) for key, rows in groups.items()}
+        return self._groups.get(first_key, self._no_rows)
+
+    def series(self, first_key, sectors):
+        # (last key level of each row, {sector: list of values}) for one first_key, in row order
+        rows = self.group_rows(first_key)
+        dates = self.index.get_level_values(-1)[rows].tolist()
+        values = self.columns_for(sectors)[rows]
+        return dates, {sector: values[:, position].tolist() for position, sector in enumerate(sectors)}
+
+
+def first_record(rows):
+    # Edge helper for the make_pie_chart_* functions: the first row of a SectorTable (e.g. a
+    # collected EnergyDataset) or of a one-row DataFrame from a parse_* view
+    if isinstance(rows, SectorRecord):
+        return rows
+    if isinstance(rows, SectorTable):
+        return next(rows.records())
+    row = rows.drop(columns=['Date'], errors='ignore').iloc[0]
+    return SectorRecord(row.name, row.to_numpy(dtype=float), {sector: position for position, sector in enumerate(row.index)})
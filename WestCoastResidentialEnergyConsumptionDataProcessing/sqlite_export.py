@@ -0,0 +1,128 @@
+import math
+import sqlite3
+import time
+
+import numpy as np
+
+import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+from instrumentation import instrumented, stage
+from regions import region_registry, available_regions, has_electricity_data
+from sector_records import SectorTable
+
+# Exports the normalized and allocated annual tables to a local SQLite database, so
+# other tools can query the numbers behind the charts without running the pipeline:
+#
+#   python eia_cli.py export --database eia.sqlite
+#   sqlite3 eia.sqlite "SELECT year, value FROM allocated_combined
+#                       WHERE region = 'WASHINGTON' AND sector = 'Residential' ORDER BY year"
+#
+# Every data table is (region, year, sector, value) with the key as its clustered
+# primary key (WITHOUT ROWID), so lookups by region, region-year or region-year-sector
+# are index seeks, and a (region, sector, year) index serves one sector's series. In
+# electricity_generation the sector column holds the source.
+# Regions are stored by their enum name, see the regions table for the rest.
+#
+# Everything is written in one transaction with executemany. Later exports upsert: per
+# table and region only the years from revision_years before the newest stored year on
+# are written (EIA revises its most recent figures), plus every year of regions not
+# stored yet, and a row is only rewritten when its value changed. full=True rewrites all.
+
+revision_years = 2
+
+data_tables = {
+    'natural_gas': 'MMcf',
+    'electricity_sales': 'thousand megawatthours',
+    'electricity_generation': 'thousand megawatthours',
+    'allocated_combined': 'MMcf',
+    'allocated_split': 'MMcf',
+}
+
+
+def _create_tables(connection):
+    for table in data_tables:
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table} (region TEXT NOT NULL, year INTEGER NOT NULL, '
+                           f'sector TEXT NOT NULL, value REAL, PRIMARY KEY (region, year, sector)) WITHOUT ROWID')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_series ON {table} (region, sector, year)')
+    connection.execute('CREATE TABLE IF NOT EXISTS regions (name TEXT PRIMARY KEY, print_name TEXT, '
+                       'abbreviation TEXT, members TEXT)')
+    connection.execute('CREATE TABLE IF NOT EXISTS tables (name TEXT PRIMARY KEY, units TEXT, exported_at REAL)')
+
+
+def _stored_years(connection, table):
+    return dict(connection.execute(f'SELECT region, MAX(year) FROM {table} GROUP BY region'))
+
+
+def _rows(records, since_years):
+    # (region, year, sector, value) of a (Region, Date) SectorTable, only for the years from
+    # since_years[region] on (all years of regions not in it); NaN goes in as NULL
+    region_names = [region.name for region in records.index.get_level_values(0)]
+    years = records.index.get_level_values(1).astype(int).to_numpy()
+    since = np.array([since_years.get(name, -math.inf) for name in region_names])
+    selected = np.flatnonzero(years >= since)
+
+    sector_count = len(records.sectors)
+    row_positions = np.repeat(selected, sector_count)
+    sector_positions = np.tile(np.arange(sector_count), len(selected))
+    values = records.values[row_positions, sector_positions]
+    values = np.where(np.isnan(values), None, values).tolist()
+    return zip([region_names[row] for row in row_positions], years[row_positions].tolist(),
+               [records.sectors[sector] for sector in sector_positions], values)
+
+
+def _upsert(connection, table, records, full):
+    since_years = {}
+    if not full:
+        since_years = {region: year - revision_years + 1 for region, year in _stored_years(connection, table).items()}
+    before = connection.total_changes
+    with stage('upsert', table):
+        connection.executemany(f'INSERT INTO {table} (region, year, sector, value) VALUES (?, ?, ?, ?) '
+                               f'ON CONFLICT (region, year, sector) DO UPDATE SET value = excluded.value '
+                               f'WHERE value IS NOT excluded.value', _rows(records, since_years))
+    return connection.total_changes - before
+
+
+def export_regions():
+    # Regions with natural gas files on hand and published (or summable) retail sales
+    published = set(pipeline.electricity_sales_index(pipeline.retail_sales_of_electricity_path).regions())
+    return [region for region in available_regions(pipeline.data_folder) if has_electricity_data(region, published)]
+
+
+@instrumented('export_to_sqlite')
+def export_to_sqlite(database_path, regions=None, full=False):
+    # Returns {table: rows inserted or changed}
+    regions = export_regions() if regions is None else list(regions)
+
+    ng_records = SectorTable.from_frame(pipeline.natural_gas_data_by_region(regions))
+    electricity_records = SectorTable.from_frame(pipeline.electricity_data_by_region(regions))
+    tables = {
+        'natural_gas': ng_records,
+        'electricity_sales': electricity_records,
+        'electricity_generation': SectorTable.from_frame(pipeline.electricity_generation_data_by_region(regions)),
+        'allocated_combined': pipeline.allocate_ng_records(ng_records, electricity_records, True),
+        'allocated_split': pipeline.allocate_ng_records(ng_records, electricity_records, False),
+    }
+
+    # isolation_level=None: the transaction is opened and committed here, not per statement
+    connection = sqlite3.connect(database_path, isolation_level=None)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            _create_tables(connection)
+            changes = {table: _upsert(connection, table, records, full) for table, records in tables.items()}
+            connection.executemany('INSERT OR REPLACE INTO regions VALUES (?, ?, ?, ?)',
+                                   [(region.name, region_registry[region].print_name,
+                                     region_registry[region].abbreviation,
+                                     ','.join(member.name for member in region_registry[region].members))
+                                    for region in regions])
+            exported_at = time.time()
+            connection.executemany('INSERT OR REPLACE INTO tables VALUES (?, ?, ?)',
+                                   [(table, units, exported_at) for table, units in data_tables.items()])
+            # Statistics, so the planner picks the series index for region-sector queries
+            connection.execute('ANALYZE')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.close()
+    return changes
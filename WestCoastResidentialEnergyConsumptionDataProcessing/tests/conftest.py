@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+# The modules sit flat next to each other, as when eia_cli.py is run from its folder
+package_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, package_folder)
+sys.path.insert(0, os.path.join(package_folder, 'benchmarks'))
+
+from synthetic_eia_data import write_synthetic_eia_data
+
+
+def write_eia_folder(folder):
+    # 3 states x 22 years (2002-2023) plus 24 months (2022-2023), returns the USEIA_Data/ path
+    write_synthetic_eia_data(str(folder), states=3, years=22, months=24)
+    return os.path.join(str(folder), 'USEIA_Data')
+
+
+@pytest.fixture
+def pipeline():
+    import eia_data_loader
+    import WestCoastResidentialEnergyConsumptionDataProcessing as pipeline
+
+    eia_data_loader.clear_table_cache()
+    yield pipeline
+    eia_data_loader.clear_table_cache()
+
+
+@pytest.fixture
+def eia_folder(tmp_path, pipeline):
+    # A fresh synthetic USEIA_Data/ (and disk cache next to it) per test, set as the data folder
+    folder = write_eia_folder(tmp_path)
+    pipeline.set_data_folder(folder)
+    return folder
+
+
+@pytest.fixture
+def traced():
+    import instrumentation
+
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
@@ -0,0 +1,14 @@
+import pandas as pd
+
+import instrumentation
+
+
+def assert_same_rows(table, expected):
+    # Appended tables hold the same rows as a full parse, not necessarily in the same order
+    order = [column for column in expected.columns if column != 'Value']
+    pd.testing.assert_frame_equal(table.sort_values(order).reset_index(drop=True),
+                                  expected.sort_values(order).reset_index(drop=True), check_dtype=False)
+
+
+def append_updates():
+    return sum(totals['calls'] for totals in instrumentation.summary() if totals['stage'] == 'append_update')
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from regions import Region
+from source_edits import drop_year_column
+
+state_regions = [Region.WASHINGTON, Region.OREGON, Region.CALIFORNIA]
+years = [2002, 2016, 2023]
+
+
+# The parsing and allocation of the original single year script, as the reference for parity
+
+def original_natural_gas_at_year(path, year):
+    data = pd.read_csv(path, skiprows=2)
+    data = data.dropna(subset=['Date'])
+    data['Date'] = data['Date'].astype(int)
+    data = data.fillna(0)
+    if 'Unnamed: 10' in data.columns:
+        data.drop(columns=['Unnamed: 10'], inplace=True)
+    keywords = {'Residential': 'Residential', 'Commercial': 'Commercial', 'Industrial': 'Industrial',
+                'Vehicle Fuel Consumption': 'Vehicle Fuel', 'Electric Power': 'Electric Power',
+                'Delivered to Consumers': 'Total Delivered'}
+    data = data.rename(columns={column: name for column in data.columns
+                                for keyword, name in keywords.items() if keyword in column})
+    data = data[['Date'] + list(keywords.values())]
+    return data[data['Date'] == year]
+
+
+def original_electricity_at_year(path, year, location):
+    data = pd.read_csv(path, skiprows=4)
+    data = data[['description', str(year)]].copy()
+    data['Sector'] = data['description'].str.extract(r': (.*)')[0].fillna(data['description'])
+    data[str(year)] = pd.to_numeric(data[str(year)], errors='coerce').fillna(0)
+    rename_map = {'all sectors': 'Total Delivered', 'residential': 'Residential', 'commercial': 'Commercial',
+                  'industrial': 'Industrial', 'transportation': 'Vehicle Fuel', 'other': 'Other'}
+    data['Sector'] = data['Sector'].apply(lambda sector: rename_map.get(sector.lower().strip(), sector.strip()))
+    location_data = data[data['description'].str.contains(location)]
+    pivot = location_data.pivot_table(index='description', columns='Sector', values=str(year), aggfunc='sum').fillna(0)
+    final = pivot.reset_index(drop=True).sum(axis=0).to_frame().transpose()
+    final.insert(0, 'Date', year)
+    return final
+
+
+def original_allocation(ng_data, electricity_data, combine):
+    ng_for_electric_power = ng_data['Electric Power'].iloc[0]
+    usage = electricity_data.drop(columns=['Date', 'Total Delivered'])
+    ng_allocation = usage.div(usage.sum(axis=1).iloc[0]).apply(lambda x: x * ng_for_electric_power)
+    for sector in ng_allocation.columns:
+        if sector not in ng_data.columns:
+            ng_data[sector] = 0
+        if combine:
+            ng_data[sector] = ng_data[sector] + ng_allocation[sector].values
+        else:
+            ng_data[sector + ' Electricity'] = ng_allocation[sector].values
+    return ng_data
+
+
+def single_year_allocation(pipeline, region, year, combine):
+    return pipeline.allocate_ng_to_electricity_sectors(
+        pipeline.parse_natural_gas_data_for_state_at_year(pipeline.ng_data_path_dict[region], year),
+        pipeline.parse_electricity_data_by_sector(pipeline.retail_sales_of_electricity_path, year,
+                                                  pipeline.electricity_data_region_string[region]),
+        combine)
+
+
+@pytest.mark.parametrize('combine', [True, False])
+def test_single_year_allocation_matches_original(eia_folder, pipeline, combine):
+    for region in state_regions:
+        for year in years:
+            expected = original_allocation(
+                original_natural_gas_at_year(pipeline.ng_data_path_dict[region], year).reset_index(drop=True),
+                original_electricity_at_year(pipeline.retail_sales_of_electricity_path, year,
+                                             pipeline.electricity_data_region_string[region]),
+                combine)
+            allocated = single_year_allocation(pipeline, region, year, combine)
+            pd.testing.assert_frame_equal(allocated.reset_index(drop=True), expected, check_dtype=False,
+                                          check_column_type=False, check_names=False)
+
+
+@pytest.mark.parametrize('combine', [True, False])
+def test_batch_allocation_matches_single_year(eia_folder, pipeline, combine):
+    batch = pipeline.allocated_ng_records_by_region(state_regions, years, combine)
+    for region in state_regions:
+        for year in years:
+            single = single_year_allocation(pipeline, region, year, combine).iloc[0]
+            record = batch.record((region, year))
+            assert set(batch.sectors) == set(single.index) - {'Date'}
+            for sector in batch.sectors:
+                assert record[sector] == single[sector], (region, year, sector)
+
+
+def test_split_allocation_columns_in_canonical_order(eia_folder, pipeline):
+    batch = pipeline.allocated_ng_records_by_region([Region.WASHINGTON], [2016], False)
+    electricity_columns = [sector for sector in batch.sectors if sector.endswith(' Electricity')]
+    assert electricity_columns == [sector + ' Electricity' for sector in pipeline.electricity_usage_sectors]
+
+
+@pytest.mark.parametrize('combine', [True, False])
+def test_allocation_keeps_direct_use_without_sales(eia_folder, pipeline, combine):
+    drop_year_column(pipeline.retail_sales_of_electricity_path, 2016)
+    natural_gas = pipeline.natural_gas_data_by_region([Region.WASHINGTON])
+    with np.errstate(all='raise'):
+        allocated = pipeline.allocated_ng_records_by_region([Region.WASHINGTON], [2015, 2016, 2017], combine)
+    assert not np.isnan(allocated.values).any()
+    record = allocated.record((Region.WASHINGTON, 2016))
+    for sector in ['Residential', 'Commercial', 'Industrial', 'Vehicle Fuel']:
+        assert record[sector] == natural_gas.loc[(Region.WASHINGTON, 2016), sector]
@@ -0,0 +1,27 @@
+import pytest
+
+import instrumentation
+from chart_rendering import render_charts
+from regions import Region
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_rendered_figures_counted_once(eia_folder, pipeline, tmp_path, traced, workers):
+    jobs = pipeline.build_chart_jobs(['natural-gas', 'electricity'], [Region.WASHINGTON, Region.OREGON], [2016],
+                                     str(tmp_path))
+    assert len(render_charts(jobs, workers)) == len(jobs)
+    assert sum(totals['figures'] for totals in instrumentation.summary()) == len(jobs)
+
+
+def test_atlas_pdf_skipped_when_up_to_date(eia_folder, pipeline, tmp_path):
+    regions = [Region.WASHINGTON, Region.OREGON]
+
+    def make_atlas(years, incremental):
+        return pipeline.make_chart_atlas(['natural-gas', 'electricity'], regions, years, str(tmp_path), 'year', 'pdf',
+                                         1, incremental)
+
+    written = make_atlas([2016, 2017], True)
+    assert len(written) == 1 and written[0].endswith('.pdf')
+    assert make_atlas([2016, 2017], True) == []
+    assert make_atlas([2016, 2018], True) == written
+    assert make_atlas([2016, 2018], False) == written
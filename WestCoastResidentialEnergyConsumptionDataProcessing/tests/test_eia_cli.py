@@ -0,0 +1,48 @@
+import pytest
+
+import eia_cli
+
+
+def run_cli(folder, *argv):
+    return eia_cli.main(['--data-dir', folder] + list(argv))
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['charts', '--charts', 'natural-gas', '--years', '1990'], 'No data for 1990'),
+    (['atlas', '--years', '1990', '--regions', 'WA'], 'No data for 1990'),
+    (['charts', '--charts', 'generation', '--regions', 'NEW_ENGLAND'], 'No data for NEW_ENGLAND'),
+    (['charts', '--charts', 'over-time', '--regions', 'TX'], 'No data for TEXAS'),
+    (['query', '--regions', 'TX'], 'No data for TEXAS'),
+    (['export', '--regions', 'TX'], 'No data for TEXAS'),
+])
+def test_selection_without_data_is_a_usage_error(eia_folder, tmp_path, capsys, argv, message):
+    if argv[0] in ('charts', 'atlas'):
+        argv = argv + ['--output-dir', str(tmp_path / 'charts')]
+    with pytest.raises(SystemExit) as exit_info:
+        run_cli(eia_folder, *argv)
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+def test_query_without_rows_in_the_years(eia_folder, capsys):
+    assert run_cli(eia_folder, 'query', '--regions', 'WA', '--years', '1990') == 0
+    output = capsys.readouterr()
+    assert 'No rows for WASHINGTON' in output.err
+    assert output.out.splitlines()[0].startswith('Region,Date,')
+    assert len(output.out.splitlines()) == 1
+
+
+def test_query_prints_the_selected_rows(eia_folder, capsys):
+    assert run_cli(eia_folder, 'query', '--regions', 'WA,OR', '--years', '2020-2023', '--sectors', 'Residential') == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Region,Date,Residential'
+    assert len(lines) == 1 + 2 * 4
+
+
+def test_years_lists_every_source(eia_folder, capsys):
+    assert run_cli(eia_folder, 'years', '--cache-only') == 0
+    assert all(line.endswith('not cached') for line in capsys.readouterr().out.splitlines())
+    assert run_cli(eia_folder, 'years') == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert 'Retail_sales_of_electricity_monthly.csv: 2022-2023' in lines
+    assert 'NG_CONS_SUM_DCU_SWA_A.csv: 2002-2023' in lines
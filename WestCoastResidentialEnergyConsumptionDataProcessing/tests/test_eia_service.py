@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from source_edits import drop_year_column
+
+
+def test_service_answers_valid_json_without_sales(eia_folder, pipeline):
+    import eia_service
+
+    drop_year_column(pipeline.retail_sales_of_electricity_path, 2016)
+    store = eia_service.build_store()
+    for query in ['regions=WA', 'regions=WA&dataset=allocated', 'regions=WA&dataset=allocated&combine=0']:
+        key = eia_service.query_key(store, eia_service.parse_qs(query))
+        json.loads(json.dumps(eia_service.answer_query(store, key), allow_nan=False))
+
+
+def test_years_outside_the_store_are_rejected_before_expanding(eia_folder):
+    import eia_service
+
+    store = eia_service.build_store()
+    with pytest.raises(ValueError, match='2002-2023'):
+        eia_service.query_key(store, eia_service.parse_qs('years=1-999999999'))
+    key = eia_service.query_key(store, eia_service.parse_qs('years=2016,2020-2021'))
+    assert key[2] == (2016, 2020, 2021)
+
+
+def test_shares_with_missing_values(eia_folder, pipeline):
+    import eia_service
+
+    drop_year_column(pipeline.retail_sales_of_electricity_path, 2016)
+    store = eia_service.build_store()
+    for query in ['regions=WA&years=2016&shares=1', 'regions=WA&years=2016&dataset=electricity&shares=1']:
+        answer = eia_service.answer_query(store, eia_service.query_key(store, eia_service.parse_qs(query)))
+        json.dumps(answer, allow_nan=False)
+    row = store.tables['natural-gas']['WASHINGTON'][2016]
+    row['Commercial'] = None
+    answer = eia_service.answer_query(store, eia_service.query_key(
+        store, eia_service.parse_qs('regions=WA&years=2016&dataset=natural-gas&shares=1')))
+    shares = answer['data']['WASHINGTON']['2016']
+    assert shares['Commercial'] is None
+    assert sum(shares[sector] for sector in ['Residential', 'Industrial', 'Vehicle Fuel', 'Electric Power']) == \
+        pytest.approx(1)
+
+
+def test_failed_query_answers_json_error(eia_folder, monkeypatch):
+    import eia_service
+
+    service = eia_service.QueryService()
+    service.store = eia_service.build_store()
+    assert service.handle('GET', '/query?years=1990')[0] == 400
+
+    def fail(store, key):
+        raise RuntimeError('broken table')
+
+    monkeypatch.setattr(eia_service, 'answer_query', fail)
+    status, body = service.handle('GET', '/query?regions=WA')
+    assert status == 500
+    assert 'broken table' in json.dumps(body)
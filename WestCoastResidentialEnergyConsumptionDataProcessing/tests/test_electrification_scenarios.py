@@ -0,0 +1,35 @@
+import numpy as np
+
+import electrification_scenarios
+from regions import Region
+from source_edits import drop_year_column
+
+state_regions = [Region.WASHINGTON, Region.OREGON, Region.CALIFORNIA]
+
+
+def test_scenario_baseline_without_data_is_zero(eia_folder):
+    baseline = electrification_scenarios.load_baseline([Region.WASHINGTON], range(1990, 1995))
+    result = electrification_scenarios.evaluate_scenarios(baseline, residential_share=[0, 0.5])
+    assert result.values.shape == (2, 1, 5, len(electrification_scenarios.end_use_sectors))
+    assert not result.values.any()
+
+
+def test_default_scenario_equals_pipeline(eia_folder, pipeline):
+    regions = state_regions + [Region.WEST_COAST]
+    baseline = electrification_scenarios.load_baseline(regions, range(2002, 2024))
+    result = electrification_scenarios.evaluate_scenarios(baseline)
+    allocated = pipeline.allocated_ng_records_by_region(regions, range(2002, 2024), True)
+    keys = [(region, year) for region in regions for year in range(2002, 2024)]
+    expected = allocated.aligned(keys, electrification_scenarios.end_use_sectors)
+    np.testing.assert_allclose(result.values[0].reshape(len(keys), -1), expected, rtol=1e-9)
+
+
+def test_default_scenario_keeps_electric_power_without_generation(eia_folder, pipeline):
+    drop_year_column(pipeline.net_generation_for_all_sectors_path, 2016)
+    baseline = electrification_scenarios.load_baseline(state_regions, [2015, 2016, 2017])
+    result = electrification_scenarios.evaluate_scenarios(baseline)
+    allocated = pipeline.allocated_ng_records_by_region(state_regions, [2015, 2016, 2017], True)
+    keys = [(region, year) for region in state_regions for year in [2015, 2016, 2017]]
+    expected = allocated.aligned(keys, electrification_scenarios.end_use_sectors)
+    assert expected.any()
+    np.testing.assert_allclose(result.values[0].reshape(len(keys), -1), expected, rtol=1e-9)
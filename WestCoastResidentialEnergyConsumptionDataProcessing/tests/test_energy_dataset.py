@@ -0,0 +1,10 @@
+from energy_dataset import EnergyDataset
+
+
+def test_empty_selection_collects_empty_tables(eia_folder):
+    dataset = EnergyDataset().region('WA', 'OR').years(range(1990, 1995))
+    assert len(dataset.collect()) == 0
+    assert len(dataset.electricity().collect()) == 0
+    allocated = dataset.sectors('Residential').allocated(emissions=True).collect()
+    assert len(allocated) == 0
+    assert allocated.sectors == ['Residential', 'Residential Electricity CO2']
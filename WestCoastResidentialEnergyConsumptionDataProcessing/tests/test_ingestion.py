@@ -0,0 +1,27 @@
+import pytest
+
+import eia_data_loader
+import instrumentation
+from source_edits import restore_release, write_previous_release
+from table_checks import append_updates, assert_same_rows
+
+
+def monthly_sources(folder):
+    return [(kind, path) for kind, path in eia_data_loader.discover_sources(folder)
+            if kind in eia_data_loader.appendable_kinds]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_ingest_sources_appends_stale_monthly_sources(eia_folder, traced, workers):
+    sources = monthly_sources(eia_folder)
+    assert len(sources) > 1
+    current = write_previous_release([path for _, path in sources])
+    eia_data_loader.ingest_sources(sources)
+    restore_release(current)
+
+    eia_data_loader.clear_table_cache()
+    instrumentation.reset()
+    tables = eia_data_loader.ingest_sources(sources, workers=workers)
+    assert append_updates() == len(sources)
+    for (kind, path), table in tables.items():
+        assert_same_rows(table, eia_data_loader.source_normalizers[kind](path))
@@ -0,0 +1,16 @@
+import eia_data_loader
+from regions import Region
+from source_edits import restore_release, write_previous_release
+from table_checks import append_updates, assert_same_rows
+
+
+def test_monthly_append_equals_full_parse(eia_folder, pipeline, traced):
+    path = pipeline.natural_gas_data_path(Region.WASHINGTON, eia_folder, 'M')
+    current = write_previous_release([path])
+    eia_data_loader.load_natural_gas_monthly_table(path)
+    restore_release(current)
+
+    eia_data_loader.clear_table_cache()
+    appended = eia_data_loader.load_natural_gas_monthly_table(path)
+    assert append_updates() == 1
+    assert_same_rows(appended, eia_data_loader.normalize_natural_gas_csv(path))
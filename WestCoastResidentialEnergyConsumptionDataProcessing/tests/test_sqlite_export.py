@@ -0,0 +1,19 @@
+import sqlite3
+
+import pytest
+
+import sqlite_export
+from regions import Region
+
+
+def test_repeat_export_writes_nothing(eia_folder, pipeline, tmp_path):
+    database = str(tmp_path / 'eia.sqlite')
+    first = sqlite_export.export_to_sqlite(database)
+    assert all(rows > 0 for rows in first.values())
+    assert not any(sqlite_export.export_to_sqlite(database).values())
+
+    with sqlite3.connect(database) as connection:
+        stored = dict(connection.execute("SELECT sector, value FROM allocated_split "
+                                         "WHERE region = 'WASHINGTON' AND year = 2016"))
+    allocated = pipeline.allocated_ng_records_by_region([Region.WASHINGTON], [2016], False)
+    assert stored == pytest.approx(allocated.record((Region.WASHINGTON, 2016)).as_dict())